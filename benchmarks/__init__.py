@@ -0,0 +1,12 @@
+'''
+This package provides a headless frame-time benchmark suite for pyablo
+
+run it with `python -m benchmarks`. it renders scenes from synthetic fixture
+resources using the SDL dummy drivers, so neither a display nor the real
+diabdat.mpq are needed.
+'''
+
+import os
+
+os.environ.setdefault('SDL_VIDEODRIVER', 'dummy')
+os.environ.setdefault('SDL_AUDIODRIVER', 'dummy')
@@ -0,0 +1,215 @@
+'''
+This module runs the benchmark suite and compares it against the baseline
+'''
+
+import argparse
+import json
+import os
+import sys
+import time
+import pygame
+from pyablo.audio import AudioManager
+from pyablo.game import Game
+from pyablo.resources import Resources
+from pyablo.screen import SceneStack
+from benchmarks.cases import CASES
+from benchmarks.fixtures import build_archive
+
+
+_BASELINE = os.path.join(os.path.dirname(__file__), 'baseline.json')
+
+# counts compared against the baseline, with an absolute slack for noise
+_METRICS = {
+    'blits': 0.5,
+    'pixels': 1000,
+    'presented': 1000,
+}
+
+# timings compared relative to the reference workload of the same run, with
+# an absolute slack in milliseconds. the tail percentiles are too noisy to gate,
+# the median is gated on the median of several repeats of a case
+_TIMINGS = {
+    'p50_ms': 0.1,
+}
+
+
+def percentile(samples, fraction):
+    '''
+    produce the given percentile of the samples by nearest rank
+    '''
+    ordered = sorted(samples)
+    return ordered[min(len(ordered) - 1, int(fraction * len(ordered)))]
+
+
+def calibrate(rounds=25, batch=20):
+    '''
+    time a fixed blit workload in milliseconds, the speed of the machine the
+    timings of a run are compared by
+    '''
+    source = pygame.Surface((640, 480))
+    target = pygame.Surface((640, 480))
+
+    samples = []
+    for _ in range(rounds):
+        start = time.perf_counter()
+        for _ in range(batch):
+            target.blit(source, (0, 0))
+        samples.append((time.perf_counter() - start) * 1000)
+    return round(percentile(samples, 0.5), 3)
+
+
+def run_case(case, frames, fps):
+    '''
+    run the main loop for the given case and produce its measurements
+    '''
+    Resources.cache.clear()
+    Game.scenes = SceneStack('benchmarks.cases')
+    for (name, args) in case.setup():
+        Game.scenes.push(name, args=args)
+
+    latencies = []
+    blits = pixels = presented = 0
+
+    # this mirrors one iteration of Game.main, minus the event handling
+    for _ in range(frames):
+        if not Game.scenes:
+            break
+
+        start = time.perf_counter()
+        debug = Game.screen.debug
+        (blits_before, pixels_before) = (debug.blits, debug.pixels)
+        presented_before = Game.screen.presented
+
+        try:
+            pygame.event.pump()
+            Game.scenes.poll()
+            scene = Game.scenes.peek()
+            if scene is None:
+                continue
+            scene.tick()
+            scene.render()
+            Game.screen.flip()
+        except StopIteration:
+            Game.scenes.pop()
+
+        latencies.append((time.perf_counter() - start) * 1000)
+        blits += debug.blits - blits_before
+        pixels += debug.pixels - pixels_before
+        presented += Game.screen.presented - presented_before
+
+        Game.clock.tick(fps)
+
+    while Game.scenes:
+        Game.scenes.pop()
+
+    count = len(latencies)
+    return {
+        'frames': count,
+        'p50_ms': round(percentile(latencies, 0.5), 3),
+        'p90_ms': round(percentile(latencies, 0.9), 3),
+        'p99_ms': round(percentile(latencies, 0.99), 3),
+        'blits': round(blits / count, 2),
+        'pixels': round(pixels / count),
+        'presented': round(presented / count),
+    }
+
+
+def run_repeats(case, frames, fps, repeats):
+    '''
+    run the given case repeatedly and produce the median of each measurement
+
+    a single run of a case is at the mercy of the scheduler, the median of a
+    few of them is stable enough to gate on.
+    '''
+    runs = [run_case(case, frames, fps) for _ in range(repeats)]
+    return {key: percentile([run[key] for run in runs], 0.5) for key in runs[0]}
+
+
+def regressions(result, baseline, tolerance):
+    '''
+    produce the metrics of a result that regressed past the baseline
+
+    timings are scaled by the reference workloads of both runs, so that a
+    slower or busier machine does not count as regression.
+    '''
+    failed = []
+    for (metric, slack) in _METRICS.items():
+        if metric in baseline and result[metric] > baseline[metric] * (1 + tolerance) + slack:
+            failed.append('%s %s > %s' % (metric, result[metric], baseline[metric]))
+
+    if 'reference_ms' not in baseline:
+        return failed
+
+    speed = result['reference_ms'] / baseline['reference_ms']
+    for (metric, slack) in _TIMINGS.items():
+        if metric not in baseline:
+            continue
+        expected = baseline[metric] * speed
+        if result[metric] > expected * (1 + tolerance) + slack:
+            failed.append('%s %s > %.3f' % (metric, result[metric], expected))
+    return failed
+
+
+def main():
+    '''
+    the benchmark runner
+    '''
+    parser = argparse.ArgumentParser(prog='python -m benchmarks', description=__doc__)
+    parser.add_argument('cases', nargs='*', help='cases to run, all by default')
+    parser.add_argument('--frames', type=int, default=120, help='frames per case')
+    parser.add_argument('--fps', type=int, default=60, help='frame rate limit')
+    parser.add_argument('--repeats', type=int, default=3,
+                        help='runs per case, their median is compared')
+    parser.add_argument('--tolerance', type=float, default=0.25,
+                        help='allowed relative regression against the baseline')
+    parser.add_argument('--baseline', default=_BASELINE, help='baseline file')
+    parser.add_argument('--update', action='store_true',
+                        help='store the results as new baseline')
+    args = parser.parse_args()
+
+    Game.init('pyablo benchmark')
+    Game.audio = AudioManager()
+    Resources.mount(build_archive())
+
+    baseline = dict()
+    if os.path.exists(args.baseline):
+        with open(args.baseline) as stream:
+            baseline = json.load(stream)
+
+    cases = [case for case in CASES if not args.cases or case.name in args.cases]
+    results = dict()
+    failed = False
+
+    print('%-16s %6s %8s %8s %8s %8s %10s %10s' % (
+        'case', 'frames', 'p50 ms', 'p90 ms', 'p99 ms', 'blits', 'pixels', 'presented'))
+    reference = calibrate()
+    print('%-16s %6s %8.3f' % ('reference', '', reference))
+    for case in cases:
+        try:
+            result = dict(run_repeats(case, args.frames, args.fps, max(1, args.repeats)),
+                          reference_ms=reference)
+        except Exception as ex:  # pylint: disable=broad-except
+            print('%-16s error: %s: %s' % (case.name, type(ex).__name__, ex))
+            failed = True
+            continue
+
+        results[case.name] = result
+        print('%(name)-16s %(frames)6d %(p50_ms)8.3f %(p90_ms)8.3f %(p99_ms)8.3f '
+              '%(blits)8.2f %(pixels)10d %(presented)10d' % dict(result, name=case.name))
+
+        for line in regressions(result, baseline.get(case.name, {}), args.tolerance):
+            print('%-16s regression: %s' % ('', line))
+            failed = True
+
+    if args.update:
+        baseline.update(results)
+        with open(args.baseline, 'w') as stream:
+            json.dump(baseline, stream, indent=2, sort_keys=True)
+            stream.write('\n')
+        return 0
+
+    return 1 if failed else 0
+
+
+if __name__ == '__main__':
+    sys.exit(main())
@@ -0,0 +1,190 @@
+'''
+This module defines the benchmark cases
+
+every case prepares the game state and produces the name of the scene stack
+module and the scenes to push, bottom first. screen settings are part of the
+case, so the same scene can be measured along different presentation paths.
+'''
+
+import numpy
+import pygame
+from pyablo.game import Game
+from pyablo.resources import Resources
+# the game scenes are imported to make them available to the scene stack
+from pyablo.scenes import (  # pylint: disable=unused-import
+    Scene, CutScene, IntroSplashScene, LoadingScene, MainMenuScene)
+from pyablo.screen import Screen
+from pyablo.text import Text
+from pyablo.tiles import TileLayer
+
+
+class ImageScene(Scene):
+    '''
+    a single static image
+    '''
+    MANIFEST = ('menu_background.pcx',)
+
+    def __init__(self):
+        '''
+        constructor
+        '''
+        super(ImageScene, self).__init__()
+
+        self.add_child(Resources.open('menu_background.pcx'))
+
+
+class AnimatedImageScene(Scene):
+    '''
+    a single animated image on a black background
+    '''
+    MANIFEST = ('logo_flames_large.pcx',)
+
+    def __init__(self):
+        '''
+        constructor
+        '''
+        super(AnimatedImageScene, self).__init__()
+
+        self.add_child(Resources.open('logo_flames_large.pcx'), (45, 182))
+
+
+class TextScene(Scene):
+    '''
+    a few lines of static text and a frame counter
+    '''
+    MANIFEST = (
+        'glyph_xlarge_gold.pcx', 'glyph_large_gold.pcx', 'glyph_medium_gold.pcx',
+        'glyph_small_gold.pcx', 'glyph_medium_grey.pcx')
+
+    def __init__(self):
+        '''
+        constructor
+        '''
+        super(TextScene, self).__init__()
+
+        for (row, size) in enumerate(('xlarge', 'large', 'medium', 'small')):
+            self.add_child(Text('The quick brown fox', size, 'gold'), (20, 20 + row * 50))
+
+        self._frames = 0
+        self._counter = Text('0', 'medium', 'grey')
+        self.add_child(self._counter, (20, 400))
+
+    def on_update(self):
+        '''
+        update callback
+        '''
+        super(TextScene, self).on_update()
+
+        self._frames += 1
+        self._counter.text = 'frame %d' % (self._frames % 60)
+
+
+class SpritesScene(Scene):
+    '''
+    a few hundred small animated images sharing one frame sheet
+    '''
+    MANIFEST = ('logo_flames_small.pcx',)
+
+    def __init__(self):
+        '''
+        constructor
+        '''
+        super(SpritesScene, self).__init__()
+
+        self.use_index()
+        for y in range(0, 480, 30):
+            for x in range(0, 640, 40):
+                self.add_child(Resources.open('logo_flames_small.pcx'), (x, y))
+
+
+class TileScene(Scene):
+    '''
+    a scrolled dungeon level with one tile changing every frame
+    '''
+    def __init__(self):
+        '''
+        constructor
+        '''
+        super(TileScene, self).__init__()
+
+        # the fixture archive holds no tiles, they are drawn as plain diamonds
+        tiles = []
+        for shade in range(16):
+            tile = pygame.Surface((64, 32))
+            tile.fill((255, 0, 255))
+            pygame.draw.polygon(
+                tile, (40 + shade * 8, 30 + shade * 6, 20), [(32, 0), (63, 16), (32, 31), (0, 16)])
+            tile.set_colorkey((255, 0, 255))
+            tiles.append(tile.convert())
+
+        tile_map = numpy.random.RandomState(0).randint(0, len(tiles), (64, 64))
+        self._layer = TileLayer(tiles, tile_map)
+        self.add_child(self._layer, (320 - self._layer.rect.width // 2, -700))
+        self._frames = 0
+
+    def on_update(self):
+        '''
+        update callback
+        '''
+        super(TileScene, self).on_update()
+
+        self._frames += 1
+        self._layer.set_tile(30, 30, self._frames % 16)
+
+
+class Case(object):
+    '''
+    a named benchmark configuration
+    '''
+    def __init__(self, name, scenes, damage_tracking=True, debug=False, paletted=False,
+                 scaler='transform', size=(640, 480)):
+        '''
+        constructor
+        '''
+        self.name = name
+        self.scenes = scenes
+        self.damage_tracking = damage_tracking
+        self.debug = debug
+        self.paletted = paletted
+        self.scaler = scaler
+        self.size = size
+
+    def setup(self):
+        '''
+        prepare the screen for the case and produce the scenes to push
+        '''
+        Game.screen = Screen(
+            (640, 480), damage_tracking=self.damage_tracking, paletted=self.paletted,
+            scaler=self.scaler)
+        Game.screen.resize(self.size)
+        Game.screen.cursor.image = Resources.open('cursor.pcx')
+        Game.screen.debug.enabled = self.debug
+        pygame.mouse.set_pos((320, 240))
+
+        return self.scenes
+
+
+CASES = [
+    Case('image', [('ImageScene', ())]),
+    Case('animated_image', [('AnimatedImageScene', ())]),
+    Case('text', [('TextScene', ())]),
+    Case('sprites', [('SpritesScene', ())]),
+    Case('tiles', [('TileScene', ())]),
+    Case('video', [('CutScene', ('intro_logos.smk',))]),
+    Case('main_menu', [('MainMenuScene', ())]),
+    Case('intro_splash', [('IntroSplashScene', ())]),
+    Case('cutscene', [('MainMenuScene', ()), ('CutScene', ('intro_cinematic.smk',))]),
+    Case('loading', [('LoadingScene', ())]),
+    Case('flip_full', [('MainMenuScene', ())], damage_tracking=False),
+    Case('flip_debug', [('MainMenuScene', ())], debug=True),
+    Case('paletted', [('MainMenuScene', ())], paletted=True),
+    Case('scale_transform', [('ImageScene', ())], damage_tracking=False, size=(1920, 1440)),
+    Case('scale_nearest', [('ImageScene', ())], damage_tracking=False, size=(1920, 1440),
+         scaler='nearest'),
+    Case('scale_integer', [('ImageScene', ())], damage_tracking=False, size=(1920, 1440),
+         scaler='integer'),
+    Case('scale_bilinear', [('ImageScene', ())], damage_tracking=False, size=(1920, 1440),
+         scaler='bilinear'),
+    Case('scale_partial', [('MainMenuScene', ())], size=(1920, 1440), scaler='integer'),
+    Case('paletted_full', [('MainMenuScene', ())], damage_tracking=False, paletted=True),
+]
@@ -0,0 +1,140 @@
+'''
+This module provides synthetic stand-ins for the resources in diabdat.mpq
+'''
+
+import io
+import av
+import numpy
+import pygame
+from pyablo.resources import _NAMED_RESOURCES
+
+
+# sizes of the decoded images, animated sheets are given per frame
+_IMAGE_SIZES = {
+    'cursor.pcx':               (33, 29),
+    'glyph_xlarge_gold.pcx':    (42, 42),
+    'glyph_xlarge_grey.pcx':    (42, 42),
+    'glyph_large_gold.pcx':     (30, 30),
+    'glyph_large_grey.pcx':     (30, 30),
+    'glyph_medium_gold.pcx':    (24, 24),
+    'glyph_medium_grey.pcx':    (24, 24),
+    'glyph_small_gold.pcx':     (16, 16),
+    'glyph_small_grey.pcx':     (16, 16),
+    'intro_splash.pcx':         (640, 480),
+    'logo_flames_large.pcx':    (550, 216),
+    'logo_flames_medium.pcx':   (390, 154),
+    'logo_flames_small.pcx':    (200, 80),
+    'menu_background.pcx':      (640, 480),
+}
+
+# glyph sheets stack one cell per character
+_GLYPH_COUNT = 256
+
+
+class FixtureArchive(object):
+    '''
+    an in-memory archive of synthetic resource files
+    '''
+    def __init__(self, files):
+        '''
+        constructor - lay out the files in the given order
+        '''
+        self._files = files
+
+        self._offsets = dict()
+        position = 0
+        for (name, data) in files.items():
+            self._offsets[name] = position
+            position += len(data)
+
+    def open(self, name):
+        '''
+        produce a file-like object for the named file
+        '''
+        try:
+            return io.BytesIO(self._files[name])
+        except KeyError as ex:
+            raise KeyError('There is no item named %r in the archive' % name) from ex
+
+    def offset(self, name):
+        '''
+        produce the position of the named file in the archive
+        '''
+        return self._offsets[name]
+
+
+def _image(size, frames, seed):
+    '''
+    encode a paletted test pattern of the given size as an image file
+    '''
+    (width, height) = size
+    surface = pygame.Surface((width, height * frames), 0, 8)
+    surface.set_palette([(i, (i * 7 + seed) % 256, 255 - i) for i in range(256)])
+    surface.fill(0)
+
+    for frame in range(frames):
+        top = frame * height
+        pygame.draw.rect(surface, 1 + (seed + frame) % 255,
+                         (width // 4, top + height // 4, width // 2, height // 2))
+        pygame.draw.line(surface, 255, (0, top), (width - 1, top + height - 1))
+
+    data = io.BytesIO()
+    pygame.image.save(surface, data, 'fixture.bmp')
+    return data.getvalue()
+
+
+def _video(size, rate, seconds):
+    '''
+    encode a test video with a mono audio track
+    '''
+    data = io.BytesIO()
+    container = av.open(data, mode='w', format='matroska')
+
+    video = container.add_stream('mpeg4', rate=rate)
+    (video.width, video.height) = size
+    video.pix_fmt = 'yuv420p'
+
+    audio = container.add_stream('pcm_s16le', rate=22050)
+    audio.layout = 'mono'
+
+    pixels = numpy.zeros((size[1], size[0], 3), dtype=numpy.uint8)
+    for index in range(rate * seconds):
+        pixels[:, :, 0] = index * 4 % 256
+        pixels[:, index * 4 % size[0], :] = 255
+        frame = av.VideoFrame.from_ndarray(pixels, format='rgb24')
+        for packet in video.encode(frame):
+            container.mux(packet)
+
+    samples = 22050 // rate
+    tone = (numpy.sin(numpy.arange(samples) / 8.0) * 8000).astype(numpy.int16)
+    for index in range(rate * seconds):
+        frame = av.AudioFrame.from_ndarray(tone.reshape(1, -1), format='s16', layout='mono')
+        frame.sample_rate = 22050
+        frame.pts = index * samples
+        for packet in audio.encode(frame):
+            container.mux(packet)
+
+    for stream in (video, audio):
+        for packet in stream.encode(None):
+            container.mux(packet)
+    container.close()
+
+    return data.getvalue()
+
+
+def build_archive(video_seconds=4):
+    '''
+    produce a fixture archive with a stand-in for every named resource
+    '''
+    files = dict()
+
+    for (seed, (name, resource)) in enumerate(sorted(_NAMED_RESOURCES.items())):
+        if resource.name.endswith('.smk'):
+            files[resource.name] = _video((640, 480), resource.kwargs['fps'], video_seconds)
+        elif name.startswith('glyph_'):
+            files[resource.name] = _image(_IMAGE_SIZES[name], _GLYPH_COUNT, seed)
+        else:
+            files[resource.name] = _image(
+                _IMAGE_SIZES[name], resource.kwargs.get('count', 1), seed)
+
+    return FixtureArchive(files)
@@ -2,6 +2,8 @@
 This module is the entry point of pyablo
 '''
 
+import os
+from pyablo.audio import AudioManager
 from pyablo.resources import Resources
 from pyablo.screen import Screen, SceneStack
 from pyablo.game import Game
@@ -11,23 +13,32 @@ def main():
     '''
     pyablo's main function
     '''
-    # initialize the game resources
-    Resources.load('resources/diabdat.mpq')
+    # initialize the game resources, optionally keeping decoded images and
+    # transcoded videos across launches in the given directory
+    Resources.load('resources/diabdat.mpq', cache_dir=os.environ.get('PYABLO_CACHE'))
 
-    # initialize the game
-    Game.init('Diablo', max_fps=60)
+    # initialize the game with a fixed simulation rate and idle throttling,
+    # optionally recording frame times for analysis
+    Game.init('Diablo', max_fps=60, profile_dump=os.environ.get('PYABLO_PROFILE'),
+              tick_rate=60, idle=True)
 
-    # initialize the screen
-    Game.screen = Screen((640, 480))
+    # initialize the screen with the configured scaling method
+    Game.screen = Screen(
+        (640, 480), damage_tracking=True, scaler=os.environ.get('PYABLO_SCALER', 'transform'))
+
+    # initialize the audio with a pool of mixer channels
+    Game.audio = AudioManager()
+
+    Resources.pin('cursor.pcx')
     Game.screen.cursor.image = Resources.open('cursor.pcx')
     Game.screen.debug.enabled = True
 
-    # initialize the scene stack
-    Game.scenes = SceneStack('pyablo.scenes')
-    Game.scenes.push('MainMenuScene')
-    Game.scenes.push('IntroSplashScene')
-    Game.scenes.push('CutScene', args=('intro_cinematic.smk',))
-    Game.scenes.push('CutScene', args=('intro_logos.smk',))
+    # initialize the scene stack, scenes are constructed when first shown
+    Game.scenes = SceneStack('pyablo.scenes', loading='LoadingScene')
+    Game.scenes.push('MainMenuScene', lazy=True)
+    Game.scenes.push('IntroSplashScene', lazy=True)
+    Game.scenes.push('CutScene', args=('intro_cinematic.smk',), lazy=True)
+    Game.scenes.push('CutScene', args=('intro_logos.smk',), lazy=True)
 
     # start the main loop
     Game.main()
@@ -0,0 +1,347 @@
+'''
+This module provides audio playback with streamed tracks and cached sounds
+'''
+
+import numpy
+import pygame
+from pyablo.cache import ResourceCache
+
+
+def frequency():
+    '''
+    produce the sample rate of the mixer
+    '''
+    return pygame.mixer.get_init()[0]
+
+
+def resampler():
+    '''
+    produce a resampler to the sample format of the mixer
+
+    all decoded audio goes through this one configuration, mono signed 16 bit
+    at the mixer frequency, so that it can be handed to the mixer as is.
+    '''
+    import av
+
+    return av.AudioResampler(format='s16p', layout='mono', rate=frequency())
+
+
+def resample(convert, frame):
+    '''
+    produce the samples of a decoded audio frame in the mixer format, as a
+    list of arrays
+
+    a frame of None flushes the samples still held by the resampler.
+    '''
+    return [out.to_ndarray()[0] for out in convert.resample(frame)]
+
+
+def decode(resource):
+    '''
+    decode the audio track of a file-like object into a sound, which is
+    empty if there is no audio track
+    '''
+    import av
+
+    resource.seek(0)
+    samples = []
+    with av.open(resource) as data:
+        if data.streams.audio:
+            convert = resampler()
+            samples = [
+                chunk for frame in data.decode(audio=0) for chunk in resample(convert, frame)]
+            samples.extend(resample(convert, None))
+
+    if not samples:
+        return pygame.mixer.Sound(numpy.zeros(0, numpy.int16))
+    return pygame.mixer.Sound(numpy.concatenate(samples))
+
+
+class SampleChunks(object):
+    '''
+    serve chunks of a decoded audio track to an AudioStream
+    '''
+    def __init__(self, samples, start, size):
+        '''
+        constructor - serve from sample start in chunks of size samples
+        '''
+        self._samples = samples
+        self._position = start
+        self._size = size
+
+    def get(self):
+        '''
+        produce the next chunk, or None at the end of the track
+        '''
+        if self.finished:
+            return None
+
+        chunk = self._samples[self._position:self._position + self._size]
+        self._position += self._size
+        return chunk
+
+    @property
+    def finished(self):
+        '''
+        produce whether the track has been served completely
+        '''
+        return self._position >= len(self._samples)
+
+
+class AudioStream(object):
+    '''
+    play a sequence of decoded chunks through a queue on one channel
+
+    chunks are taken from a buffer providing get(), which produces None if
+    no chunk is ready, and finished. only one chunk is queued ahead of the
+    playing one, so a long track is never held in memory as a whole. if a
+    presentation clock is given, it follows the playback from the position
+    offset in seconds and is paused while the buffer starves. whenever a
+    chunk starts playing, the clock is moved to the samples played so far.
+
+    if the chunks come from a decoder of their own, it is stopped along with
+    the stream.
+    '''
+    def __init__(self, manager, chunks, clock=None, offset=0.0, decoder=None):
+        '''
+        constructor
+        '''
+        self._manager = manager
+        self._chunks = chunks
+        self._decoder = decoder
+        self._clock = clock
+        self._offset = offset
+        self._channel = None
+        self._started = False
+
+        # samples of the chunks played before the playing one, of the playing
+        # one and of the queued one, and the time of the last feed
+        self._played = 0
+        self._playing = 0
+        self._queued = None
+        self._fed = None
+
+    def _position(self, samples=0):
+        '''
+        produce the playback position in seconds after the given number of
+        samples of the playing chunk
+        '''
+        return self._offset + float(self._played + samples) / frequency()
+
+    @property
+    def started(self):
+        '''
+        produce whether playback has started
+        '''
+        return self._started
+
+    @property
+    def finished(self):
+        '''
+        produce whether all chunks have been played
+        '''
+        return (self._started and self._chunks.finished and
+                (self._channel is None or not self._channel.get_busy()))
+
+    def feed(self):
+        '''
+        keep the channel supplied with chunks, call once per frame
+        '''
+        if self.finished:
+            return
+
+        (fed, self._fed) = (self._fed, pygame.time.get_ticks())
+        if self._channel is None:
+            self._channel = self._manager.acquire(hold=True)
+            if self._channel is None:
+                return
+        elif self._channel.get_queue() is not None:
+            return
+        elif self._queued is not None:
+            # the queued chunk started playing since the last feed
+            self._played += self._playing
+            (self._playing, self._queued) = (self._queued, None)
+            if self._clock is not None:
+                position = self._position()
+                self._clock.sync(position, position + (self._fed - fed) / 1000.0)
+
+        chunk = self._chunks.get()
+        if chunk is None:
+            # hold the presentation clock while the audio output starves
+            if (self._clock is not None and self._started and
+                    not self._channel.get_busy() and not self._chunks.finished):
+                self._clock.pause()
+                self._clock.sync(self._position(self._playing))
+            return
+
+        sound = pygame.mixer.Sound(chunk)
+        if not self._started:
+            self._started = True
+            self._channel.play(sound)
+            self._playing = len(chunk)
+            if self._clock is not None:
+                self._clock.start(self._offset)
+        elif not self._channel.get_busy():
+            self._channel.play(sound)
+            self._played += self._playing
+            self._playing = len(chunk)
+            if self._clock is not None:
+                self._clock.resume()
+                self._clock.sync(self._position())
+        else:
+            self._channel.queue(sound)
+            self._queued = len(chunk)
+
+    def pause(self):
+        '''
+        pause playback
+        '''
+        if self._channel is not None:
+            self._channel.pause()
+
+    def resume(self):
+        '''
+        continue paused playback
+        '''
+        if self._channel is not None:
+            self._channel.unpause()
+
+    def stop(self):
+        '''
+        stop playback and return the channel to the pool
+        '''
+        if self._decoder is not None:
+            self._decoder.stop()
+        if self._channel is not None:
+            self._channel.stop()
+            self._manager.release(self._channel)
+            self._channel = None
+        self._manager.forget(self)
+
+
+class AudioManager(object):
+    '''
+    manage the mixer channels, streamed tracks and cached sounds
+
+    short sounds are decoded from the resources once and kept in an LRU
+    cache with a byte budget. channels are taken from a fixed pool, streams
+    hold theirs until they are stopped.
+    '''
+    def __init__(self, channels=8, budget=8 * 1024 * 1024):
+        '''
+        constructor
+        '''
+        pygame.mixer.set_num_channels(channels)
+        self._channels = [pygame.mixer.Channel(i) for i in range(channels)]
+        self._held = set()
+        self._streams = []
+
+        self.sounds = ResourceCache(budget)
+
+    def acquire(self, hold=False):
+        '''
+        produce an idle channel of the pool, or None if all are in use
+
+        a held channel is not handed out again until it is released.
+        '''
+        for (i, channel) in enumerate(self._channels):
+            if i not in self._held and not channel.get_busy():
+                if hold:
+                    self._held.add(i)
+                return channel
+        return None
+
+    def release(self, channel):
+        '''
+        return a held channel to the pool
+        '''
+        self._held.discard(self._channels.index(channel))
+
+    def forget(self, stream):
+        '''
+        drop a stopped stream
+        '''
+        if stream in self._streams:
+            self._streams.remove(stream)
+
+    def sound(self, name):
+        '''
+        produce the named sound from the resources, decoded once while cached
+        '''
+        from pyablo.resources import Resources
+
+        sound = self.sounds.get(name)
+        if sound is None:
+            sound = decode(Resources.fopen(name))
+            self.sounds.put(name, sound)
+        return sound
+
+    def play(self, sound, loops=0):
+        '''
+        play a sound, or the named sound, on an idle channel of the pool
+
+        produce the channel, or None if no channel was free
+        '''
+        if isinstance(sound, str):
+            sound = self.sound(sound)
+
+        channel = self.acquire()
+        if channel is not None:
+            channel.play(sound, loops)
+        return channel
+
+    def stream(self, chunks, clock=None, offset=0.0, decoder=None):
+        '''
+        produce a stream playing the given chunks, see AudioStream
+        '''
+        stream = AudioStream(self, chunks, clock, offset, decoder)
+        self._streams.append(stream)
+        return stream
+
+    def track(self, name):
+        '''
+        stream the named audio file from the resources
+
+        the file is decoded in chunks on a worker thread while it plays, so
+        long tracks such as music are never held in memory as a whole.
+        '''
+        from pyablo.resources import Resources
+        from pyablo.stream import TrackDecoder
+
+        decoder = TrackDecoder(Resources.fopen(name))
+        decoder.start()
+        return self.stream(decoder.audio, decoder=decoder)
+
+    def feed(self):
+        '''
+        keep all streams supplied with chunks and drop finished ones, call
+        once per frame
+        '''
+        for stream in list(self._streams):
+            if stream.finished:
+                stream.stop()
+            else:
+                stream.feed()
+
+    def stop(self):
+        '''
+        stop all streams and sounds
+        '''
+        for stream in list(self._streams):
+            stream.stop()
+        for channel in self._channels:
+            channel.stop()
+
+    @property
+    def busy(self):
+        '''
+        produce the number of channels playing
+        '''
+        return sum(1 for channel in self._channels if channel.get_busy())
+
+    @property
+    def streams(self):
+        '''
+        produce the number of active streams
+        '''
+        return len(self._streams)
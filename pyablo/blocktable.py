@@ -0,0 +1,154 @@
+'''
+This module provides the positions of the files in an mpq archive
+'''
+
+import re
+import struct
+
+
+# magic, header size, archive size, format version, sector size shift,
+# hash table position, block table position, hash table and block table sizes
+_HEADER = struct.Struct('<4sIIHHIIII')
+_MAGIC = b'MPQ\x1a'
+
+# headers start at a multiple of this offset
+_HEADER_ALIGNMENT = 512
+
+# hash table entries that end a probe, and deleted entries
+_EMPTY = 0xffffffff
+_DELETED = 0xfffffffe
+
+# the names given to files without a known name, by their block index
+_PSEUDO_NAME = re.compile(r'^File(\d{8})\.\w+$')
+
+
+def _crypt_table():
+    '''
+    produce the table the hashes and the table encryption are derived from
+    '''
+    table = [0] * 0x500
+    seed = 0x00100001
+    for first in range(0x100):
+        for index in range(first, 0x500, 0x100):
+            seed = (seed * 125 + 3) % 0x2aaaab
+            high = (seed & 0xffff) << 16
+            seed = (seed * 125 + 3) % 0x2aaaab
+            table[index] = high | (seed & 0xffff)
+    return table
+
+
+_CRYPT_TABLE = _crypt_table()
+
+
+def hash_string(name, kind):
+    '''
+    produce the hash of the given kind of an archive file name
+    '''
+    (seed1, seed2) = (0x7fed7fed, 0xeeeeeeee)
+    for char in name.upper().encode('ascii'):
+        value = _CRYPT_TABLE[(kind << 8) + char]
+        seed1 = (value ^ (seed1 + seed2)) & 0xffffffff
+        seed2 = (char + seed1 + seed2 + (seed2 << 5) + 3) & 0xffffffff
+    return seed1
+
+
+def decrypt(data, key):
+    '''
+    produce the words of an encrypted table
+    '''
+    words = struct.unpack('<%dI' % (len(data) // 4), data)
+    result = []
+    seed = 0xeeeeeeee
+    for word in words:
+        seed = (seed + _CRYPT_TABLE[0x400 + (key & 0xff)]) & 0xffffffff
+        value = word ^ ((key + seed) & 0xffffffff)
+        result.append(value)
+        key = ((((~key) << 0x15) + 0x11111111) & 0xffffffff) | (key >> 0x0b)
+        seed = (value + seed + (seed << 5) + 3) & 0xffffffff
+    return result
+
+
+class BlockTable(object):
+    '''
+    the positions of the files of an mpq archive
+
+    the block table is read once, the hash table only once a file is looked
+    up by its real name. files named File00000000.ext after their block
+    index, as listed in pyablo.resources, are found without hashing.
+    '''
+    def __init__(self, path):
+        '''
+        constructor - read the block table of the archive at path
+
+        raise ValueError if the file is not an mpq archive
+        '''
+        self._path = path
+        self._hashes = None
+
+        with open(path, 'rb') as archive:
+            self._base = None
+            position = 0
+            while True:
+                archive.seek(position)
+                data = archive.read(_HEADER.size)
+                if len(data) < _HEADER.size:
+                    raise ValueError('not an mpq archive: %s' % path)
+                if data[:4] == _MAGIC:
+                    break
+                position += _HEADER_ALIGNMENT
+
+            (_, _, _, _, _, self._hash_position, block_position, self._hash_size,
+             block_size) = _HEADER.unpack(data)
+            self._base = position
+
+            archive.seek(position + block_position)
+            words = decrypt(archive.read(block_size * 16), hash_string('(block table)', 3))
+
+        # the words of an entry are position, compressed size, size and flags
+        self._positions = [position + words[i] for i in range(0, len(words), 4)]
+
+    def _read_hashes(self):
+        '''
+        produce the decrypted hash table
+        '''
+        if self._hashes is None:
+            with open(self._path, 'rb') as archive:
+                archive.seek(self._base + self._hash_position)
+                data = archive.read(self._hash_size * 16)
+            self._hashes = decrypt(data, hash_string('(hash table)', 3))
+        return self._hashes
+
+    def _block(self, name):
+        '''
+        produce the block index of the named file, or None
+        '''
+        match = _PSEUDO_NAME.match(name)
+        if match is not None:
+            return int(match.group(1))
+
+        hashes = self._read_hashes()
+        (first, second) = (hash_string(name, 1), hash_string(name, 2))
+        start = hash_string(name, 0) % self._hash_size
+        for step in range(self._hash_size):
+            entry = 4 * ((start + step) % self._hash_size)
+            block = hashes[entry + 3]
+            if block == _EMPTY:
+                return None
+            if block != _DELETED and hashes[entry] == first and hashes[entry + 1] == second:
+                return block
+        return None
+
+    def offset(self, name):
+        '''
+        produce the position of the named file in the archive, or None
+        '''
+        block = self._block(name)
+        if block is None or block >= len(self._positions):
+            return None
+        return self._positions[block]
+
+    def __len__(self):
+        '''
+        produce the number of blocks
+        '''
+        return len(self._positions)
@@ -0,0 +1,161 @@
+'''
+This module provides a memory-bounded cache for decoded game resources
+'''
+
+import threading
+from collections import OrderedDict
+import pygame
+
+
+def sizeof(value):
+    '''
+    estimate the memory held by a decoded resource in bytes
+    '''
+    if isinstance(value, pygame.Surface):
+        return value.get_pitch() * value.get_height()
+    if isinstance(value, pygame.mixer.Sound):
+        return value.get_view().length
+    return getattr(value, 'nbytes', 0)
+
+
+class ResourceCache(object):
+    '''
+    a least recently used cache of decoded resources with a byte budget
+
+    pinned keys are never evicted and do not need to be present when pinned.
+    '''
+    def __init__(self, budget=64 * 1024 * 1024):
+        '''
+        constructor
+        '''
+        self._entries = OrderedDict()
+        self._pinned = set()
+        self._budget = budget
+        self._bytes = 0
+        self._lock = threading.RLock()
+
+        self.hits = 0
+        self.misses = 0
+        self.evictions = 0
+
+    @property
+    def budget(self):
+        '''
+        produce the byte budget of the cache
+        '''
+        return self._budget
+
+    @budget.setter
+    def budget(self, value):
+        '''
+        set the byte budget of the cache, evicting entries if necessary
+        '''
+        with self._lock:
+            self._budget = value
+            self._evict()
+
+    @property
+    def nbytes(self):
+        '''
+        produce the number of bytes held by cached entries
+        '''
+        return self._bytes
+
+    @property
+    def stats(self):
+        '''
+        produce the cache statistics as a dict
+        '''
+        return {
+            'entries': len(self._entries),
+            'bytes': self._bytes,
+            'hits': self.hits,
+            'misses': self.misses,
+            'evictions': self.evictions,
+        }
+
+    def get(self, key):
+        '''
+        produce the cached value for key, or None on a miss
+        '''
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry is None:
+                self.misses += 1
+                return None
+
+            self._entries.move_to_end(key)
+            self.hits += 1
+            return entry[0]
+
+    def put(self, key, value, size=None):
+        '''
+        store a decoded value, evicting least recently used entries
+        '''
+        if size is None:
+            size = sizeof(value)
+
+        with self._lock:
+            if key in self._entries:
+                self._bytes -= self._entries.pop(key)[1]
+
+            self._entries[key] = (value, size)
+            self._bytes += size
+            self._evict()
+
+    def discard(self, key):
+        '''
+        drop the entry for key if present, pinned or not
+        '''
+        with self._lock:
+            entry = self._entries.pop(key, None)
+            if entry is not None:
+                self._bytes -= entry[1]
+
+    def pin(self, key):
+        '''
+        protect the entry for key from eviction
+        '''
+        with self._lock:
+            self._pinned.add(key)
+
+    def unpin(self, key):
+        '''
+        allow the entry for key to be evicted again
+        '''
+        with self._lock:
+            self._pinned.discard(key)
+            self._evict()
+
+    def clear(self):
+        '''
+        drop all entries that are not pinned
+        '''
+        with self._lock:
+            for key in [k for k in self._entries if k not in self._pinned]:
+                self._bytes -= self._entries.pop(key)[1]
+
+    def _evict(self):
+        '''
+        drop least recently used entries until the budget is met
+        '''
+        for key in list(self._entries):
+            if self._bytes <= self._budget:
+                break
+            if key in self._pinned:
+                continue
+
+            self._bytes -= self._entries.pop(key)[1]
+            self.evictions += 1
+
+    def __contains__(self, key):
+        '''
+        check whether a value for key is cached, without touching it
+        '''
+        return key in self._entries
+
+    def __len__(self):
+        '''
+        produce the number of cached entries
+        '''
+        return len(self._entries)
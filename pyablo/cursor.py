@@ -9,14 +9,26 @@ from pygame import Rect
 class CursorOverlay(object):
     '''
     manage the pygame cursor
+
+    the cursor image is shown as an SDL colour cursor if the platform
+    supports it, so that moving the pointer costs no drawing at all. the
+    fallback is a software cursor drawn onto the window surface, which saves
+    the pixels under it to erase itself without redrawing the frame.
     '''
-    def __init__(self):
+    def __init__(self, hardware=True):
         '''
         constructor - set defaults
         '''
         self._visible = True
         self._image = None
 
+        self._hardware = False
+        self._allow_hardware = hardware
+
+        # the window pixels under the software cursor and where they are from
+        self._under = None
+        self._saved = None
+
     @property
     def image(self):
         '''
@@ -28,9 +40,28 @@ class CursorOverlay(object):
     def image(self, value):
         '''
         set the image of the cursor
+
+        the pixels saved under a drawn software cursor are kept, so that the
+        next restore still erases the previous image.
         '''
         self._image = value
-        pygame.mouse.set_visible(value is None and self.visible)
+        if self._saved is None:
+            self._under = None
+
+        was_hardware = self._hardware
+        self._hardware = False
+        if value is not None and self._allow_hardware:
+            self._hardware = self._set_system_cursor(value.source)
+        if was_hardware and not self._hardware:
+            pygame.mouse.set_cursor(pygame.SYSTEM_CURSOR_ARROW)
+        self._update_visibility()
+
+    @property
+    def hardware(self):
+        '''
+        produce whether the cursor is drawn by the system
+        '''
+        return self._hardware
 
     @property
     def visible(self):
@@ -45,24 +76,80 @@ class CursorOverlay(object):
         set the visibility state of the cursor
         '''
         self._visible = value
-        pygame.mouse.set_visible(self._image is None and value)
+        self._update_visibility()
 
-    def draw(self, surface):
+    def _update_visibility(self):
+        '''
+        show the system cursor unless the cursor image is drawn in software
+        '''
+        pygame.mouse.set_visible(self._visible and (self._image is None or self._hardware))
+
+    @staticmethod
+    def _set_system_cursor(source):
         '''
-        draw the cursor unconditionally
+        make the system cursor a colour cursor of the given image
+
+        produce whether the platform accepted the cursor
         '''
+        # the colorkey becomes transparency in the cursor
+        surface = pygame.Surface(source.get_size(), pygame.SRCALPHA)
+        surface.fill((0, 0, 0, 0))
+        surface.blit(source, (0, 0))
+
+        try:
+            pygame.mouse.set_cursor(pygame.cursors.Cursor((0, 0), surface))
+        except pygame.error:
+            return False
+        return True
+
+    def locate(self, surface):
+        '''
+        produce the rect of the software cursor on the given surface
+
+        the cursor is clamped to the surface. the rect is relative to the
+        surface, or None if nothing is drawn.
+        '''
+        if not self._visible or self._image is None or self._hardware:
+            return None
+
         rect = Rect(surface.get_abs_offset(), surface.get_size())
         pos = pygame.mouse.get_pos()
 
         clipped = (
-            min(max(pos[0], rect.left), rect.right),
-            min(max(pos[1], rect.top), rect.bottom))
-
-        if pos != clipped:
-            pygame.mouse.set_pos(clipped)
+            min(max(pos[0], rect.left), rect.right) - rect.left,
+            min(max(pos[1], rect.top), rect.bottom) - rect.top)
 
         self._image.rect.topleft = clipped
+        return self._image.rect.clip(surface.get_rect())
+
+    def restore(self, surface):
+        '''
+        erase the software cursor by restoring the pixels saved under it
+
+        produce the restored rect, or None if there was nothing to restore
+        '''
+        if self._saved is None:
+            return None
+
+        rect = self._saved
+        self._saved = None
+        surface.blit(self._under, rect, ((0, 0), rect.size))
+        return rect
+
+    def draw(self, surface):
+        '''
+        save the pixels under the software cursor and draw it
+
+        produce the drawn rect, or None if nothing is drawn
+        '''
+        rect = self.locate(surface)
+        if rect is None:
+            return None
 
-        if self._visible and self._image is not None:
-            self._image.do_draw(surface, self._image.rect)
+        if self._under is None or self._under.get_size() != self._image.rect.size:
+            self._under = pygame.Surface(self._image.rect.size, 0, surface)
+        self._under.blit(surface, (0, 0), rect)
+        self._saved = rect
 
+        self._image.do_draw(surface, rect)
+        return rect
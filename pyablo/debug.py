@@ -4,6 +4,11 @@ This module provides some debug information in an overlay
 
 import pygame
 from pyablo.game import Game
+from pyablo.resources import Resources
+
+
+# the frame time in milliseconds at the top of the frame time graph
+_GRAPH_RANGE = 50.0
 
 
 class DebugOverlay(object):
@@ -18,6 +23,10 @@ class DebugOverlay(object):
         self._enabled = False
         self.redraws = []
 
+        # running totals of scene graph blits, for profiling and benchmarks
+        self.blits = 0
+        self.pixels = 0
+
     @property
     def enabled(self):
         '''
@@ -32,21 +41,84 @@ class DebugOverlay(object):
         '''
         self._enabled = value
 
+    def record(self, rect):
+        '''
+        account for a blit into the given rect
+        '''
+        self.blits += 1
+        self.pixels += rect.width * rect.height
+        if self._enabled:
+            self.redraws.append(rect)
+
+    def record_blits(self, blits):
+        '''
+        account for a sequence of (surface, dest, area) blits
+        '''
+        self.blits += len(blits)
+        self.pixels += sum(area.width * area.height for (_, _, area) in blits)
+        if self._enabled:
+            self.redraws.extend(pygame.Rect(dest, area.size) for (_, dest, area) in blits)
+
     def draw(self, surface):
         '''
         update the debug info on the given surface unconditionally
+
+        produce the list of rects touched on the surface
         '''
         if not self._enabled:
-            return
+            return []
 
-        scene = "scene: %s" % type(Game.scenes.peek()).__name__
-        fps = "fps: %.1f" % Game.clock.get_fps()
+        scene = Game.scenes.peek()
+        lines = [
+            "scene: %s" % type(scene).__name__,
+            "fps: %.1f" % Game.clock.get_fps(),
+            "pacing: %.2f ms jitter, %d missed" % (Game.pacer.jitter, Game.pacer.missed),
+            "cache: %(hits)d hits, %(misses)d misses, %(evictions)d evictions" %
+            Resources.cache.stats,
+            "events: %(received)d received, %(merged)d merged, %(dropped)d dropped" %
+            Game.events.stats,
+            "audio: %d streams, %d channels busy, %d sounds cached" % (
+                Game.audio.streams, Game.audio.busy, len(Game.audio.sounds)),
+            "startup: %.0f ms to first frame" % (Game.first_frame or 0.0),
+        ] + scene.debug_info()
 
-        label = self._font.render(scene, 1, (255, 255, 255))
-        surface.blit(label, (10, 10))
-        label = self._font.render(fps, 1, (255, 255, 255))
-        surface.blit(label, (10, 10 + self._font.get_linesize()))
+        profiler = Game.profiler
+        lines.append("frame: p50 %.2f p99 %.2f ms" % (
+            profiler.percentile(0.5), profiler.percentile(0.99)))
+        for phase in profiler.PHASES:
+            lines.append("  %-8s p50 %.2f p99 %.2f ms" % (
+                phase, profiler.percentile(0.5, phase), profiler.percentile(0.99, phase)))
+
+        touched = []
+        for (i, line) in enumerate(lines):
+            label = self._font.render(line, 1, (255, 255, 255))
+            touched.append(surface.blit(label, (10, 10 + i * self._font.get_linesize())))
+
+        touched.append(self._draw_graph(surface, profiler.totals))
 
         for rect in self.redraws:
-            pygame.draw.rect(surface, (0, 255, 0), rect, 1)
+            touched.append(pygame.draw.rect(surface, (0, 255, 0), rect, 1))
         self.redraws.clear()
+
+        return touched
+
+    def _draw_graph(self, surface, totals):
+        '''
+        draw a graph of the recent frame times and produce its rect
+        '''
+        (width, height) = (len(totals) or 1, 60)
+        rect = pygame.Rect(10, surface.get_height() - height - 10, width, height)
+        scale = height / _GRAPH_RANGE
+
+        # mark the frame time budget of the frame rate limit
+        if Game.max_fps:
+            budget = rect.bottom - 1000.0 / Game.max_fps * scale
+            pygame.draw.line(surface, (255, 0, 0), (rect.left, budget), (rect.right, budget))
+
+        points = [
+            (rect.left + x, rect.bottom - min(total, _GRAPH_RANGE) * scale)
+            for (x, total) in enumerate(totals)]
+        if len(points) > 1:
+            pygame.draw.lines(surface, (255, 255, 0), False, points)
+
+        return rect
@@ -0,0 +1,149 @@
+'''
+This module provides a persistent on-disk cache of decoded images
+'''
+
+import hashlib
+import mmap
+import os
+import struct
+import tempfile
+import pygame
+
+
+# magic, version, width, height, pitch, bits per pixel
+_HEADER = struct.Struct('<4sHIIIB')
+_MAGIC = b'PYAB'
+_VERSION = 2
+
+# the size of the archive regions hashed to identify an archive
+_FINGERPRINT_BYTES = 64 * 1024
+
+# decoded images carry no per pixel alpha, the fourth byte of 32 bit pixels
+# is padding
+_FORMATS = {8: 'P', 24: 'RGB', 32: 'RGBX'}
+
+
+def fingerprint(path):
+    '''
+    produce a digest identifying the contents of an archive file
+
+    hashing a full archive would cost more than the cache saves, so only the
+    size, modification time, and the first and last blocks are hashed.
+    '''
+    stat = os.stat(path)
+    digest = hashlib.sha1(('%d:%d' % (stat.st_size, stat.st_mtime_ns)).encode())
+
+    with open(path, 'rb') as archive:
+        digest.update(archive.read(_FINGERPRINT_BYTES))
+        archive.seek(max(0, stat.st_size - _FINGERPRINT_BYTES))
+        digest.update(archive.read(_FINGERPRINT_BYTES))
+
+    return digest.hexdigest()
+
+
+class DiskCache(object):
+    '''
+    a directory of decoded images keyed by archive fingerprint and file name
+
+    entries hold the raw pixel rows and palette of a decoded image behind a
+    small header. they are memory mapped when loaded, so an image is mapped
+    straight into a surface without decompressing or decoding it again.
+    '''
+    def __init__(self, directory, archive):
+        '''
+        constructor - use the entries of the archive with the given fingerprint
+        '''
+        self._directory = os.path.join(directory, archive)
+        self.hits = 0
+        self.misses = 0
+
+    def path(self, name, suffix='.raw'):
+        '''
+        produce the entry path of the given archive file name
+
+        other kinds of entries than decoded images use another suffix.
+        '''
+        return os.path.join(self._directory, name.replace('/', '_').replace('\\', '_') + suffix)
+
+    def __contains__(self, name):
+        '''
+        check whether the named file has an entry, without loading it
+        '''
+        return os.path.exists(self.path(name))
+
+    def load(self, name):
+        '''
+        produce the cached image of the named file as a surface, or None
+        '''
+        try:
+            with open(self.path(name), 'rb') as entry:
+                data = mmap.mmap(entry.fileno(), 0, access=mmap.ACCESS_COPY)
+        except (OSError, ValueError):
+            self.misses += 1
+            return None
+
+        # truncated or foreign entries are misses, they are replaced on store
+        try:
+            (magic, version, width, height, pitch, bits) = _HEADER.unpack_from(data)
+            if magic != _MAGIC or version != _VERSION or bits not in _FORMATS:
+                raise struct.error('not a cache entry')
+
+            offset = _HEADER.size
+            palette = None
+            if bits == 8:
+                palette = struct.unpack_from('768B', data, offset)
+                offset += 768
+            if len(data) < offset + pitch * height:
+                raise struct.error('truncated cache entry')
+        except struct.error:
+            self.misses += 1
+            return None
+
+        # the surface keeps the mapping alive for as long as it references it
+        pixels = memoryview(data)[offset:offset + pitch * height]
+        surface = pygame.image.frombuffer(pixels, (width, height), _FORMATS[bits], pitch)
+        if palette is not None:
+            surface.set_palette([palette[i:i + 3] for i in range(0, 768, 3)])
+
+        self.hits += 1
+        return surface
+
+    def store(self, name, surface):
+        '''
+        write the decoded surface of the named file to the cache
+
+        entries are written to a temporary file and renamed, so that loaders
+        in other threads or processes never see partial entries.
+        '''
+        bits = surface.get_bitsize()
+        if bits not in _FORMATS:
+            return
+
+        if bits == 8:
+            data = pygame.image.tobytes(surface, 'P')
+            palette = bytes(c for colour in surface.get_palette() for c in colour[:3])
+        else:
+            data = pygame.image.tobytes(surface, _FORMATS[bits])
+            palette = b''
+        (width, height) = surface.get_size()
+        pitch = len(data) // height if height else 0
+
+        try:
+            os.makedirs(self._directory, exist_ok=True)
+            (handle, temp) = tempfile.mkstemp(dir=self._directory)
+        except OSError:
+            # the cache is an optimization, a read-only disk is not an error
+            return
+
+        try:
+            with os.fdopen(handle, 'wb') as entry:
+                entry.write(_HEADER.pack(_MAGIC, _VERSION, width, height, pitch, bits))
+                entry.write(palette.ljust(768 if bits == 8 else 0, b'\0'))
+                entry.write(data)
+            os.replace(temp, self.path(name))
+        except OSError:
+            # a full disk leaves a partial temporary file behind
+            try:
+                os.remove(temp)
+            except OSError:
+                pass
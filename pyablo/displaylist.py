@@ -0,0 +1,86 @@
+'''
+This module provides the retained display list a scene is drawn from
+'''
+
+from pyablo.spatial import SpatialGrid
+
+
+class DisplayList(object):
+    '''
+    the drawables of a scene flattened into drawing order
+
+    the list is compiled once from the scene graph and kept until drawables
+    are added or removed, moved drawables only update the index. a frame then
+    visits only the list instead of walking the graph, and produces the
+    blits of all its damage as one sequence for Surface.blits.
+    '''
+    def __init__(self, roots, cell_size=None):
+        '''
+        constructor - flatten the graph below the given roots
+
+        with a cell size, the drawables are found through a spatial index.
+        '''
+        self.nodes = []
+        pending = list(reversed(roots))
+        while pending:
+            node = pending.pop()
+            self.nodes.append(node)
+            pending.extend(reversed(node.children))
+
+        self._index = None
+        if cell_size is not None:
+            self._index = SpatialGrid(cell_size)
+            for node in self.nodes:
+                self._index.insert(node, node.rect)
+
+    def move(self, node):
+        '''
+        update the index after a drawable of the list changed its rect
+        '''
+        if self._index is not None:
+            self._index.move(node, node.rect)
+
+    def compile(self, rects):
+        '''
+        produce the blits redrawing the given rects, and the rects to clear
+
+        drawables below an opaque drawable covering a whole rect are hidden
+        and produce no blits. drawables without a surface of their own
+        produce their blits themselves. the rects to clear are those no
+        opaque drawable covers, they need a fill before the blits.
+        '''
+        blits = []
+        uncovered = []
+        for rect in rects:
+            nodes = self.nodes if self._index is None else self._index.query([rect])
+
+            layers = []
+            start = None
+            for node in nodes:
+                if not rect.colliderect(node.rect):
+                    continue
+
+                clip = rect.clip(node.rect)
+                surface = node.surface
+                if surface is None:
+                    layers.extend(node.blits(clip))
+                    continue
+
+                area = clip.move(-node.rect.left, -node.rect.top)
+                if (not node.transparent and clip == rect and
+                        area.right <= surface.get_width() and area.bottom <= surface.get_height()):
+                    start = len(layers)
+                layers.append((surface, clip.topleft, area))
+
+            if start is None:
+                uncovered.append(rect)
+                start = 0
+            blits.extend(layers[start:])
+
+        return (blits, uncovered)
+
+    def __len__(self):
+        '''
+        produce the number of drawables
+        '''
+        return len(self.nodes)
@@ -2,17 +2,26 @@
 This module provides drawables used in pyablo scenes
 '''
 
-import itertools
-import av
+import numpy
 import pygame
 from pygame import Rect
+from pyablo.audio import SampleChunks, decode, frequency
 from pyablo.game import Game
+from pyablo.stream import FrameConverter, PresentationClock, StreamDecoder
 
 
 class Drawable(object):
     '''
     a node in the scene graph
+
+    a node whose redraw flag or rect changes marks itself and its ancestors
+    dirty, and nodes that change with time register as ticking, so that
+    updates and ticks only descend into subtrees that are dirty or ticking.
     '''
+    __slots__ = (
+        '_rect', '_children', 'transparent', '_surface', '_redraw', '_damage', '_dirty',
+        '_ticking', '_ticks', 'parent')
+
     def __init__(self):
         '''
         constructor
@@ -22,10 +31,15 @@ class Drawable(object):
 
         self.transparent = False
         self._surface = None
-        self.redraw = False
-        self._redraw_rects = []
+        self._redraw = False
+        self._damage = []
         self.parent = None
 
+        # whether a redraw is pending in the subtree, and its ticking nodes
+        self._dirty = False
+        self._ticking = False
+        self._ticks = 0
+
     @property
     def rect(self):
         '''
@@ -37,8 +51,132 @@ class Drawable(object):
     def rect(self, value):
         '''
         set the rect of the sceneobject
+
+        moving or resizing a drawable must assign a new rect, changing the
+        rect in place is not noticed. the previous rect is repainted, the new
+        one redrawn and the spatial index of the scene updated.
         '''
+        if self.parent is not None and self._rect and self._rect != value:
+            self.damage(self._rect.copy())
         self._rect = value
+        self.redraw = True
+        if self.parent is not None:
+            self.parent.child_moved(self)
+
+    @property
+    def redraw(self):
+        '''
+        produce whether the sceneobject needs to be redrawn
+        '''
+        return self._redraw
+
+    @redraw.setter
+    def redraw(self, value):
+        '''
+        request or cancel a redraw of the sceneobject
+        '''
+        self._redraw = bool(value)
+        if value:
+            self.mark_dirty()
+
+    def damage(self, rect):
+        '''
+        request a repaint of the given screen rect with the next update
+        '''
+        self._damage.append(rect)
+        self.mark_dirty()
+
+    def mark_dirty(self):
+        '''
+        mark the subtree of this node dirty, up to the scene
+        '''
+        if not self._dirty:
+            self._dirty = True
+            if self.parent is not None:
+                self.parent.mark_dirty()
+
+    @property
+    def ticking(self):
+        '''
+        produce whether the sceneobject changes with time
+        '''
+        return self._ticking
+
+    @ticking.setter
+    def ticking(self, value):
+        '''
+        register or unregister the sceneobject for ticks
+        '''
+        value = bool(value)
+        if value != self._ticking:
+            self._ticking = value
+            self.count_ticks(1 if value else -1)
+
+    @property
+    def dirty(self):
+        '''
+        produce whether a redraw is pending in the subtree
+        '''
+        return self._dirty
+
+    @property
+    def ticks(self):
+        '''
+        produce the number of ticking nodes in the subtree
+        '''
+        return self._ticks
+
+    def count_ticks(self, delta):
+        '''
+        account for ticking nodes added to or removed from the subtree
+        '''
+        self._ticks += delta
+        if self.parent is not None:
+            self.parent.count_ticks(delta)
+
+    @property
+    def children(self):
+        '''
+        produce the child sceneobjects in drawing order
+        '''
+        return self._children
+
+    @property
+    def surface(self):
+        '''
+        produce the surface drawn for the sceneobject, or None
+        '''
+        return self._surface
+
+    def region(self):
+        '''
+        produce the rects covered by the sceneobject and its descendants
+        '''
+        rects = [self.rect.copy()]
+        for child in self._children:
+            rects.extend(child.region())
+        return rects
+
+    def blits(self, rect):
+        '''
+        produce the blits drawing the given rect of a sceneobject without a
+        surface of its own, as (surface, dest, area) tuples
+        '''
+        return []
+
+    def child_moved(self, child):
+        '''
+        pass the move of a descendant on to the scene
+        '''
+        if self.parent is not None:
+            self.parent.child_moved(child)
+
+    def graph_changed(self):
+        '''
+        pass a change of the scene graph below this node on to the scene
+        '''
+        if self.parent is not None:
+            self.parent.graph_changed()
 
     def add_child(self, child, pos=(0, 0)):
         '''
@@ -46,9 +184,25 @@ class Drawable(object):
         '''
         child.rect.topleft = pos
         child.parent = self
-        child.redraw = True
 
         self._children.append(child)
+        child.redraw = True
+        self.mark_dirty()
+        if child._ticks:
+            self.count_ticks(child._ticks)
+        self.graph_changed()
+
+    def remove_child(self, child):
+        '''
+        remove a child sceneobject, its region is redrawn
+        '''
+        self._children.remove(child)
+        child.parent = None
+        if child._ticks:
+            self.count_ticks(-child._ticks)
+        for rect in child.region():
+            self.damage(rect)
+        self.graph_changed()
 
     def on_update(self):
         '''
@@ -56,150 +210,588 @@ class Drawable(object):
         '''
         pass
 
+    def tick(self):
+        '''
+        tick method - advance time by Game.delta
+
+        only ticking nodes are updated, and only subtrees holding some
+        ticking node are visited.
+        '''
+        if self._ticking:
+            self.on_update()
+        for child in self._children:
+            if child._ticks:
+                child.tick()
+
+    def idle_time(self):
+        '''
+        produce how long the drawable can go without ticks in milliseconds,
+        or None if it only changes in response to events
+        '''
+        times = [child.idle_time() for child in self._children if child._ticks]
+        return min((t for t in times if t is not None), default=None)
+
     def update(self):
         '''
-        update method - advance time and calculate redraw and dirty regions
+        update method - collect the dirty regions of the node and its children,
+        the damage it recorded and its rect if it needs a redraw
+
+        the regions are redrawn from the display list of the scene, which
+        repaints everything intersecting them in drawing order. only dirty
+        subtrees are visited.
         '''
-        self.on_update()
+        self._dirty = False
 
-        dirty = []
+        dirty = self._damage
+        self._damage = []
         for child in self._children:
-            dirty.extend(child.update())
+            if child._dirty:
+                dirty.extend(child.update())
 
-        if self.redraw:
-            dirty = [self.rect]
-
-        self._redraw_rects = dirty
-        return dirty if self.transparent else []
+        if self._redraw:
+            self._redraw = False
+            dirty.append(self.rect)
+        return dirty
 
     def do_draw(self, surface, rect):
         '''
-        default draw callback
+        draw the sceneobject into the given rect of the surface on its own
         '''
         area = rect.copy()
         area.topleft = (area.left - self.rect.left, area.top - self.rect.top)
         surface.blit(self._surface, rect.topleft, area)
-        self.redraw = False
-        Game.screen.debug.redraws.append(rect)
-
-    def draw(self, surface, rects):
-        '''
-        redraw method - do the actual redrawing into the given rects
-        '''
-        for rect in self._redraw_rects:
-            self.do_draw(surface, rect)
-
-        for child in self._children:
-            redraw = [rect.clip(child.rect) for rect in rects if rect.collideswith(child.rect)]
-            child.draw(surface, redraw)
+        Game.screen.debug.record(rect)
 
 
 class Image(Drawable):
     '''
     a helper class for dealing with image files
     '''
+    __slots__ = ('_resource',)
+
     def __init__(self, resource, colorkey=None):
         '''
         constructor - store resource for later use
+
+        the resource is either a file-like object to decode, or an already
+        decoded surface shared with other images.
         '''
         super(Image, self).__init__()
 
         self._resource = resource
 
-        self._surface = pygame.image.load(self._resource).convert()
+        if isinstance(resource, pygame.Surface):
+            self._surface = resource
+        else:
+            self._surface = self.prepare(pygame.image.load(self._resource))
         self.rect = self._surface.get_rect()
 
         # key out given color
         if colorkey is not None:
             pos = (colorkey[0] % self.rect.width, colorkey[1] % self.rect.height)
-            self._surface.set_colorkey(self._surface.get_at(pos))
+            self._surface.set_colorkey(self._surface.get_at(pos), pygame.RLEACCEL)
             self.transparent = True
 
+    @staticmethod
+    def prepare(surface):
+        '''
+        convert a freshly decoded surface for blitting to the screen
+        '''
+        # paletted images stay paletted for a paletted frame buffer
+        if Game.screen.paletted and surface.get_bitsize() == 8:
+            return surface
+        return surface.convert()
+
+    @property
+    def source(self):
+        '''
+        produce the decoded surface that can be shared with other images
+        '''
+        return self._surface
+
+    @property
+    def palette(self):
+        '''
+        produce the palette of the image, or None if it is not paletted
+        '''
+        if self._surface.get_bitsize() != 8:
+            return None
+        return self._surface.get_palette()
+
+
+class FrameSheet(object):
+    '''
+    the frames of an animated image, shared between all its instances
+
+    the frames are split from the sheet into separate surfaces, so that
+    colorkeyed frames can be RLE accelerated.
+    '''
+    def __init__(self, surface, count):
+        '''
+        constructor - split the sheet into count frames stacked vertically
+        '''
+        height = surface.get_height() // count
+        colorkey = surface.get_colorkey()
+
+        self.frames = []
+        for y in range(0, height * count, height):
+            frame = surface.subsurface(0, y, surface.get_width(), height).copy()
+            if colorkey is not None:
+                frame.set_colorkey(colorkey, pygame.RLEACCEL)
+            self.frames.append(frame)
+
+    @property
+    def nbytes(self):
+        '''
+        produce the memory held by the frames
+        '''
+        return sum(frame.get_pitch() * frame.get_height() for frame in self.frames)
+
+    def __len__(self):
+        '''
+        produce the number of frames
+        '''
+        return len(self.frames)
+
 
 class AnimatedImage(Image):
     '''
     a base class for dealing with animated images
     '''
+    __slots__ = ('_sheet', '_fps', '_elapsed', '_frame')
+
     def __init__(self, resource, colorkey, fps, count):
         '''
         constructor
+
+        the resource is either a file-like object to decode, or a frame sheet
+        shared with other animated images.
         '''
-        super(AnimatedImage, self).__init__(resource, colorkey)
+        if not isinstance(resource, FrameSheet):
+            resource = FrameSheet(Image(resource, colorkey).source, count)
+
+        # the frames are keyed already
+        super(AnimatedImage, self).__init__(resource.frames[0])
+        self.transparent = colorkey is not None
 
+        self._sheet = resource
         self._fps = fps
         self._elapsed = 0
+        self._frame = 0
+        self.ticking = True
 
-        # split into animated frames
-        self._full_height = self.rect.height
-        self._full_surface = self._surface
-
-        self.rect.height //= count
-        self._frames = itertools.cycle(
-            self._full_surface.subsurface(0, y, *self.rect.size)
-            for y in range(0, self._full_height, self.rect.height))
-
-        self._surface = next(self._frames)
+    @property
+    def source(self):
+        '''
+        produce the frame sheet that can be shared with other images
+        '''
+        return self._sheet
 
     def on_update(self):
         '''
         update the animated image on screen
         '''
-        self._elapsed += Game.clock.get_time()
-        while self._elapsed >= 1000.0 / self._fps:
-            self._elapsed -= 1000.0 / self._fps
-            self._surface = next(self._frames)
+        # the frame is looked up from the elapsed time within one cycle
+        period = 1000.0 * len(self._sheet) / self._fps
+        self._elapsed = (self._elapsed + Game.delta) % period
+
+        # rounding can put the end of the cycle one past the last frame
+        frame = min(int(self._elapsed * self._fps / 1000.0), len(self._sheet) - 1)
+        if frame != self._frame:
+            self._frame = frame
+            self._surface = self._sheet.frames[frame]
             self.redraw = True
 
+    def idle_time(self):
+        '''
+        produce the time until the next frame is due
+        '''
+        due = (self._frame + 1) * 1000.0 / self._fps - self._elapsed
+        children = super(AnimatedImage, self).idle_time()
+        return due if children is None else min(due, children)
+
 
 class Video(Drawable):
     '''
     a helper class for dealing with cutscenes
     '''
-    def __init__(self, resource, fps):
+    __slots__ = (
+        '_resource', '_fps', '_elapsed', '_audio', '_channel', '_stream', '_decoder', '_store',
+        '_shown', '_paused', 'loop', '_clock', '_pending', '_dropped', 'late', '_paletted',
+        '_palette', '_indices', '_frames', '_converter', '_position')
+
+    def __init__(self, resource, fps, stream=False, depth=32, max_bytes=None, sync=False,
+                 audio=None, store=None, loop=False):
         '''
-        constructor - decode audio and video
+        constructor - decode audio and video, or start a background decoder
+
+        in streaming mode a worker thread decodes up to depth frames (and at
+        most max_bytes of pixel data) ahead of playback, so construction does
+        not wait for the audio track and the main loop never decodes.
+
+        in sync mode frames are presented by their timestamps against the
+        audio playback position instead of once per 1/fps, and frames that
+        are already late are skipped without being converted.
+
+        a previously decoded audio track can be shared through audio.
+
+        if a frame store is given, the video plays from it instead of the
+        resource, always in sync mode. such videos can seek, pause and
+        resume, and loop if loop is True.
         '''
         super(Video, self).__init__()
 
         self._resource = resource
         self._fps = fps
         self._elapsed = 0
+        self.ticking = True
+
+        self._audio = None
+        self._channel = None
+        self._stream = None
+        self._decoder = None
+
+        self._store = store
+        self._shown = None
+        self._position = 0.0
+        self._paused = False
+        self.loop = loop
+
+        self._clock = PresentationClock() if sync or store is not None else None
+        self._pending = None
+        self._dropped = 0
+        self.late = 0
+
+        # smacker frames are paletted, keep them that way if the screen is
+        self._paletted = Game.screen.paletted
+        self._palette = None
+        self._indices = None
+
+        if store is not None:
+            self._surface = self._create_surface(store.size, store.paletted)
+            self.rect = self._surface.get_rect()
+            self.seek(0.0)
+            return
+
+        if stream:
+            self._decoder = StreamDecoder(
+                self._resource, depth, max_bytes, clock=self._clock, paletted=self._paletted)
+            self._decoder.start()
+
+            self._surface = self._create_surface(self._decoder.size)
+            self.rect = self._surface.get_rect()
+            return
+
+        # pyav is only needed once a video is actually played
+        import av
 
         # decode the audio stream
+        self._audio = audio if audio is not None else decode(self._resource)
+
+        # decode the video stream, conversion is deferred until presentation
         self._resource.seek(0)
         data = av.open(self._resource)
 
-        fifo = av.AudioFifo()
-        for frame in data.decode(audio=0):
-            fifo.write(frame)
+        self._frames = ((frame.time, frame) for frame in data.decode(video=0))
+        self._converter = FrameConverter()
 
-        resampler = av.AudioResampler(format='s16p', layout='mono')
-        self._audio = pygame.mixer.Sound(
-            resampler.resample(fifo.read()).to_nd_array()[0])
+        first = next(self._frames)[1]
+        self._surface = self._create_surface((first.width, first.height))
+        self._indices = numpy.empty((first.height, first.width), numpy.uint8)
+        self._upload(first)
+        self.rect = self._surface.get_rect()
 
-        # decode the video stream
-        self._resource.seek(0)
-        data = av.open(self._resource)
+    @property
+    def source(self):
+        '''
+        produce the decoded audio track that can be shared with other videos
+        '''
+        return self._audio
 
-        self._frames = (
-            pygame.image.frombuffer(
-                frame.to_nd_array(format='rgb24'),
-                (frame.width, frame.height),
-                'RGB')
-            for frame in data.decode(video=0))
+    @property
+    def dropped(self):
+        '''
+        produce the number of frames skipped because they were late
+        '''
+        if self._decoder is not None:
+            return self._dropped + self._decoder.dropped
+        return self._dropped
 
-        self._surface = next(self._frames)
-        self.rect = self._surface.get_rect()
+    @staticmethod
+    def _create_surface(size, paletted=False):
+        '''
+        create a persistent surface for paletted or rgb24 frames
+        '''
+        if paletted:
+            return pygame.Surface(size, 0, 8)
+        return pygame.Surface(size, 0, 24, (0xff, 0xff00, 0xff0000, 0))
+
+    def _target(self, paletted):
+        '''
+        produce the persistent surface for paletted or rgb24 frames
+        '''
+        if (self._surface.get_bitsize() == 8) != paletted:
+            self._surface = self._create_surface(self._surface.get_size(), paletted)
+            self._palette = None
+        return self._surface
+
+    def _upload(self, frame):
+        '''
+        copy a decoded frame or converted pixel array into the surface
+
+        the surface is reused for every frame, so that playback allocates no
+        frame sized surfaces or arrays.
+        '''
+        if self._decoder is None and self._store is None:
+            if self._paletted and frame.format.name == 'pal8':
+                frame = self._converter.pal8_planes(frame, self._indices)
+            else:
+                frame = self._converter.rgb24_view(frame)
+
+        if not isinstance(frame, tuple):
+            pixels = pygame.surfarray.pixels3d(self._target(False))
+            pixels[...] = frame.swapaxes(0, 1)
+            del pixels
+            return
+
+        # paletted frames carry the palette of the screen
+        (indices, palette) = frame
+        pixels = pygame.surfarray.pixels2d(self._target(True))
+        pixels[...] = indices.T
+        del pixels
+        if palette != self._palette:
+            self._palette = palette
+            self._surface.set_palette(palette)
+            Game.screen.palette = palette
+
+    def _recycle(self, pixels):
+        '''
+        return the arrays of an uploaded or skipped frame to the decoder
+        '''
+        if self._decoder is None or pixels is None:
+            return
+        self._decoder.pool.give(pixels[0] if isinstance(pixels, tuple) else pixels)
+
+    def _peek_frame(self):
+        '''
+        produce the next (time, frame) pair, None if the decoder fell behind
+
+        raise StopIteration once the video is exhausted
+        '''
+        if self._decoder is None:
+            if self._pending is None:
+                self._pending = next(self._frames)
+            return self._pending
+
+        item = self._decoder.video.peek()
+        if item is None and self._decoder.video.finished:
+            if self._decoder.error is not None:
+                raise self._decoder.error
+            raise StopIteration
+        return item
+
+    def _pop_frame(self):
+        '''
+        consume the frame produced by the last _peek_frame
+        '''
+        if self._decoder is None:
+            self._pending = None
+        else:
+            self._decoder.video.get()
+
+    def _start_audio(self):
+        '''
+        start playback of the audio stream, or keep it supplied
+
+        the stream is only registered with the first update, so that videos
+        constructed ahead of time neither play nor run their clock.
+        '''
+        if self._stream is None and self._decoder is not None:
+            self._stream = Game.audio.stream(self._decoder.audio, self._clock)
+        elif self._stream is None and self._clock is not None:
+            # the clock follows the samples played, so the track is streamed
+            samples = pygame.sndarray.samples(self._audio)
+            self._stream = Game.audio.stream(
+                SampleChunks(samples, 0, int(0.25 * frequency())), self._clock)
+            if not len(samples):
+                # no audio track to follow, run on wall time
+                self._clock.start()
+
+        if self._stream is not None:
+            self._stream.feed()
+            if self._decoder is not None and self._decoder.audio.finished and \
+                    self._clock is not None and not self._clock.running:
+                # no audio track to follow, run on wall time
+                self._clock.start()
+        elif self._channel is None:
+            self._channel = Game.audio.play(self._audio)
+            if self._clock is not None:
+                self._clock.start()
+
+    def _update_synced(self):
+        '''
+        present the latest frame that is due on the presentation clock
+        '''
+        position = self._clock.time
+
+        # frames the decoder did not convert are counted by the decoder, and
+        # do not replace an older converted frame that is due
+        due = None
+        while True:
+            item = self._peek_frame()
+            if item is None or item[0] > position:
+                break
+            self._pop_frame()
+            if item[1] is None:
+                continue
+            if due is not None:
+                self._dropped += 1
+                self._recycle(due[1])
+            due = item
+
+        if due is None:
+            return
+
+        if position - due[0] > 1.0 / self._fps:
+            self.late += 1
+
+        self._upload(due[1])
+        self._recycle(due[1])
+        self.redraw = True
+
+    def seek(self, position):
+        '''
+        continue playback from the given position in seconds
+
+        only videos playing from a frame store can seek
+        '''
+        if self._store is None:
+            raise ValueError('only videos playing from a frame store can seek')
+
+        if self._stream is not None:
+            self._stream.stop()
+            self._stream = None
+        self._clock = PresentationClock()
+        self._position = position
+
+        self._shown = None
+        self._show(min(self._store.index(position), len(self._store) - 1))
+
+    def pause(self):
+        '''
+        hold playback at the current position
+        '''
+        self._paused = True
+        self.ticking = False
+        if self._clock is not None:
+            self._clock.pause()
+        if self._stream is not None:
+            self._stream.pause()
+
+    def resume(self):
+        '''
+        continue paused playback
+        '''
+        self._paused = False
+        self.ticking = True
+        if self._clock is not None:
+            self._clock.resume()
+        if self._stream is not None:
+            self._stream.resume()
+
+    @property
+    def paused(self):
+        '''
+        produce whether playback is paused
+        '''
+        return self._paused
+
+    def _show(self, index):
+        '''
+        present the frame of the store with the given index
+        '''
+        if index == self._shown:
+            return
+        if self._shown is not None and index > self._shown + 1:
+            self._dropped += index - self._shown - 1
+
+        self._shown = index
+        self._upload(self._store.frame(index))
+        self.redraw = True
+
+    def _update_stored(self):
+        '''
+        present the frame of the store due on the presentation clock
+
+        the audio from the last seek is streamed once the video is updated
+        unpaused, so that neither a video constructed ahead of time nor one
+        sought while paused starts to play.
+        '''
+        if self._stream is None:
+            self._stream = Game.audio.stream(
+                self._store.chunks(self._position), self._clock, offset=self._position)
+            if not len(self._store.samples):
+                # no audio track to follow, run on wall time
+                self._clock.start(self._position)
+        self._stream.feed()
+        if not self._clock.running:
+            return
+
+        index = self._store.index(self._clock.time)
+        if index >= len(self._store):
+            if not self.loop:
+                raise StopIteration
+            self.seek(0.0)
+            return
+
+        self._show(index)
 
     def on_update(self):
         '''
         update the video on screen
         '''
-        if self._elapsed == 0:
-            self._audio.play()
+        if self._paused:
+            return
+
+        if self._store is not None:
+            self._update_stored()
+            return
 
-        self._elapsed += Game.clock.get_time()
+        self._start_audio()
+
+        if self._clock is not None:
+            self._update_synced()
+            return
+
+        self._elapsed += Game.delta
         if self._elapsed >= 1000.0 / self._fps:
-            self._elapsed -= 1000.0 / self._fps
-            self._surface = next(self._frames)
-            self.redraw = True
+            # a late decoder holds the current frame instead of losing time
+            item = self._peek_frame()
+            if item is not None:
+                self._pop_frame()
+                self._elapsed -= 1000.0 / self._fps
+                if item[1] is not None:
+                    self._upload(item[1])
+                    self._recycle(item[1])
+                self.redraw = True
+
+    def idle_time(self):
+        '''
+        produce the time until the next update, videos need every frame
+        unless paused
+        '''
+        return None if self._paused else 0
+
+    def close(self):
+        '''
+        stop playback and release the decoder or frame store
+        '''
+        if self._decoder is not None:
+            self._decoder.stop()
+        if self._stream is not None:
+            self._stream.stop()
+            self._stream = None
+        if self._channel is not None:
+            self._channel.stop()
+        if self._store is not None:
+            self._store.close()
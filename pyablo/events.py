@@ -0,0 +1,128 @@
+'''
+This module provides the routing of pygame events to handlers and scenes
+'''
+
+import pygame
+
+
+# the input event types kept out of the queue unless handled or subscribed,
+# quit, window and system events are always queued
+_INPUT_EVENTS = tuple(getattr(pygame, name) for name in (
+    'KEYDOWN', 'KEYUP', 'TEXTINPUT', 'TEXTEDITING', 'MOUSEMOTION', 'MOUSEBUTTONDOWN',
+    'MOUSEBUTTONUP', 'MOUSEWHEEL', 'JOYAXISMOTION', 'JOYBALLMOTION', 'JOYHATMOTION',
+    'JOYBUTTONDOWN', 'JOYBUTTONUP', 'CONTROLLERAXISMOTION', 'CONTROLLERBUTTONDOWN',
+    'CONTROLLERBUTTONUP', 'FINGERDOWN', 'FINGERUP', 'FINGERMOTION', 'MULTIGESTURE',
+) if hasattr(pygame, name))
+
+
+class EventRouter(object):
+    '''
+    dispatch events to registered handlers and the active scene
+
+    handlers are registered by event type, and optionally by key for key
+    events. events without a handler go to the on_event of the active scene
+    if it subscribes to their type through its EVENTS attribute, or are
+    dropped. consecutive motion events are merged into one before dispatch.
+
+    on activating a scene, pygame is told to block the input event types
+    that are neither handled nor subscribed, so that they never reach the
+    queue.
+    '''
+    def __init__(self):
+        '''
+        constructor
+        '''
+        self._handlers = dict()
+        self._scene = None
+        self._subscribed = None
+
+        # running totals of routed events
+        self.received = 0
+        self.merged = 0
+        self.dropped = 0
+
+    def register(self, event_type, handler, key=None):
+        '''
+        call handler with events of the given type, and key if given
+        '''
+        self._handlers.setdefault((event_type, key), []).append(handler)
+        if self._scene is not None:
+            self.activate(self._scene)
+
+    def activate(self, scene, extra=()):
+        '''
+        route events to the given scene and filter the event queue for it
+
+        extra event types are queued without being routed, such as mouse
+        motion to wake an idle loop for the cursor.
+        '''
+        self._scene = scene
+        self._subscribed = getattr(scene, 'EVENTS', None)
+
+        pygame.event.set_allowed(None)
+        if self._subscribed is None:
+            return
+
+        allowed = set(self._subscribed) | set(extra)
+        allowed.update(event_type for (event_type, _) in self._handlers)
+        blocked = [event_type for event_type in _INPUT_EVENTS if event_type not in allowed]
+        if blocked:
+            pygame.event.set_blocked(blocked)
+
+    @property
+    def scene(self):
+        '''
+        produce the scene events are routed to
+        '''
+        return self._scene
+
+    def coalesce(self, events):
+        '''
+        merge runs of consecutive motion events into their last event
+
+        the merged event carries the motion of the whole run in rel and
+        the buttons held during any of it.
+        '''
+        result = []
+        for event in events:
+            previous = result[-1] if result else None
+            if (event.type == pygame.MOUSEMOTION and previous is not None and
+                    previous.type == pygame.MOUSEMOTION):
+                rel = (previous.rel[0] + event.rel[0], previous.rel[1] + event.rel[1])
+                buttons = tuple(a or b for (a, b) in zip(previous.buttons, event.buttons))
+                result[-1] = pygame.event.Event(
+                    pygame.MOUSEMOTION, event.dict, rel=rel, buttons=buttons)
+                self.merged += 1
+            else:
+                result.append(event)
+        return result
+
+    def dispatch(self, events):
+        '''
+        route the given events in order
+        '''
+        self.received += len(events)
+
+        for event in self.coalesce(events):
+            handlers = self._handlers.get((event.type, getattr(event, 'key', None)))
+            if handlers is None:
+                handlers = self._handlers.get((event.type, None))
+
+            if handlers is not None:
+                for handler in handlers:
+                    handler(event)
+            elif self._subscribed is None or event.type in self._subscribed:
+                self._scene.on_event(event)
+            else:
+                self.dropped += 1
+
+    @property
+    def stats(self):
+        '''
+        produce the routing statistics as a dict
+        '''
+        return {
+            'received': self.received,
+            'merged': self.merged,
+            'dropped': self.dropped,
+        }
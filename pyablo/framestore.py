@@ -0,0 +1,206 @@
+'''
+This module provides memory mapped cutscenes with random access to frames
+'''
+
+import mmap
+import os
+import shutil
+import struct
+import tempfile
+import numpy
+from pyablo import audio
+from pyablo.audio import SampleChunks
+from pyablo.stream import FrameConverter
+
+
+# magic, version, width, height, bytes per pixel, frames, frame time,
+# palettes, audio samples, audio rate
+_HEADER = struct.Struct('<4sHIIBIdIII')
+_MAGIC = b'PYAV'
+_VERSION = 1
+
+# frame data starts on a page boundary
+_ALIGN = mmap.PAGESIZE
+
+
+def _align(offset):
+    '''
+    round an offset up to the alignment of the frame data
+    '''
+    return -(-offset // _ALIGN) * _ALIGN
+
+
+def transcode(resource, path):
+    '''
+    decode a video resource once and store it as a frame store at path
+
+    paletted frames are stored as palette indices, with a palette record
+    only where the palette changes. other frames are stored as rgb24. the
+    audio track is stored as mixer samples. the store is written to a
+    temporary file and renamed, so that readers never see partial stores.
+    '''
+    import av
+
+    resource.seek(0)
+    with av.open(resource) as container:
+        video = container.streams.video[0]
+        streams = [video] + list(container.streams.audio[:1])
+
+        rate = video.average_rate
+        frame_time = 1.0 / float(rate) if rate else 0.0
+
+        directory = os.path.dirname(path)
+        os.makedirs(directory, exist_ok=True)
+
+        resampler = audio.resampler()
+        converter = FrameConverter()
+        samples = []
+        palettes = []
+        table = []
+        bpp = None
+
+        with tempfile.TemporaryFile(dir=directory) as frames:
+            for packet in container.demux(*streams):
+                for frame in packet.decode():
+                    if packet.stream is not video:
+                        samples.extend(audio.resample(resampler, frame))
+                        continue
+
+                    if bpp is None:
+                        bpp = 1 if frame.format.name == 'pal8' else 3
+
+                    if bpp == 1:
+                        (pixels, palette) = converter.pal8_planes(frame)
+                        if not palettes or palettes[-1] != palette:
+                            palettes.append(palette)
+                    else:
+                        pixels = converter.rgb24_view(frame)
+
+                    table.append((frame.time, len(palettes) - 1))
+                    frames.write(numpy.ascontiguousarray(pixels).data)
+
+            samples.extend(audio.resample(resampler, None))
+            track = numpy.concatenate(samples) if samples else numpy.zeros(0, numpy.int16)
+
+            header = _HEADER.pack(
+                _MAGIC, _VERSION, video.width, video.height, bpp or 3, len(table), frame_time,
+                len(palettes), len(track), audio.frequency())
+
+            (handle, temp) = tempfile.mkstemp(dir=directory)
+            try:
+                with os.fdopen(handle, 'wb') as store:
+                    store.write(header)
+                    store.write(numpy.array([t for (t, _) in table], numpy.float64).data)
+                    store.write(numpy.array([p for (_, p) in table], numpy.int32).data)
+                    store.write(numpy.array(palettes, numpy.uint8).reshape(-1, 768).data)
+                    store.write(track.astype(numpy.int16).data)
+                    store.write(b'\0' * (_align(store.tell()) - store.tell()))
+
+                    frames.seek(0)
+                    shutil.copyfileobj(frames, store)
+                os.replace(temp, path)
+            except BaseException:
+                os.unlink(temp)
+                raise
+
+
+class FrameStore(object):
+    '''
+    a transcoded cutscene mapped into memory
+
+    every frame is at a fixed offset in the mapping, so seeking to a frame
+    costs at most the page faults of reading it.
+    '''
+    def __init__(self, path):
+        '''
+        constructor - map the store at path
+
+        raise ValueError if the file is not a frame store of this version
+        '''
+        with open(path, 'rb') as store:
+            self._data = mmap.mmap(store.fileno(), 0, access=mmap.ACCESS_READ)
+
+        (magic, version, width, height, bpp, count, frame_time, palettes, samples,
+         rate) = _HEADER.unpack_from(self._data)
+        if magic != _MAGIC or version != _VERSION:
+            raise ValueError('not a frame store: %s' % path)
+
+        self.size = (width, height)
+        self.paletted = bpp == 1
+        self.frame_time = frame_time
+        self.rate = rate
+
+        offset = _HEADER.size
+        self.times = numpy.frombuffer(self._data, numpy.float64, count, offset)
+        offset += self.times.nbytes
+        self._palette_ids = numpy.frombuffer(self._data, numpy.int32, count, offset)
+        offset += self._palette_ids.nbytes
+        self._palettes = numpy.frombuffer(
+            self._data, numpy.uint8, palettes * 768, offset).reshape(palettes, 256, 3)
+        offset += self._palettes.nbytes
+        self.samples = numpy.frombuffer(self._data, numpy.int16, samples, offset)
+        offset += self.samples.nbytes
+
+        shape = (count, height, width) if self.paletted else (count, height, width, 3)
+        self._frames = numpy.frombuffer(
+            self._data, numpy.uint8, count * width * height * bpp, _align(offset)).reshape(shape)
+
+        # palettes converted for pygame, by palette record
+        self._palette_lists = dict()
+
+    @property
+    def duration(self):
+        '''
+        produce the length of the cutscene in seconds
+        '''
+        return len(self) * self.frame_time
+
+    def index(self, position):
+        '''
+        produce the index of the frame shown at the given position in seconds
+        '''
+        if not self.frame_time:
+            return 0
+        return int(position / self.frame_time)
+
+    def frame(self, index):
+        '''
+        produce the pixels of a frame as a view of the mapping
+
+        paletted frames are produced as (indices, palette) pairs
+        '''
+        pixels = self._frames[index]
+        if not self.paletted:
+            return pixels
+
+        record = int(self._palette_ids[index])
+        if record not in self._palette_lists:
+            self._palette_lists[record] = [tuple(c) for c in self._palettes[record].tolist()]
+        return (pixels, self._palette_lists[record])
+
+    def chunks(self, position=0.0, seconds=0.25):
+        '''
+        produce the audio track from the given position in seconds as chunks
+        '''
+        start = min(len(self.samples), int(position * self.rate))
+        return SampleChunks(self.samples, start, max(1, int(seconds * self.rate)))
+
+    def __len__(self):
+        '''
+        produce the number of frames
+        '''
+        return len(self.times)
+
+    def close(self):
+        '''
+        release the views of the mapping and unmap the store
+
+        views handed out before, such as audio chunks still referenced
+        elsewhere, keep the mapping alive until they are released.
+        '''
+        self.times = self.samples = None
+        self._palette_ids = self._palettes = self._frames = None
+        try:
+            self._data.close()
+        except BufferError:
+            pass
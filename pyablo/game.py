@@ -3,7 +3,25 @@ This module provides management methods for the pygame screen
 '''
 
 import sys
+from time import perf_counter
 import pygame
+from pyablo.events import EventRouter
+from pyablo.pacing import FramePacer
+from pyablo.profiler import FrameProfiler
+
+
+# the time pyablo started, for measuring the time to the first frame
+_STARTED = perf_counter()
+
+# the most simulation time in milliseconds a frame catches up on
+_MAX_LAG = 250.0
+
+# the longest idle wait in milliseconds, so that polling continues
+_IDLE_TIMEOUT = 250
+
+# the longest idle wait while audio streams need feeding, well below the
+# length of their chunks
+_STREAM_TIMEOUT = 100
 
 
 class MetaGame(type):
@@ -17,6 +35,51 @@ class MetaGame(type):
         '''
         return cls._clock
 
+    @property
+    def delta(cls):
+        '''
+        produce the time advanced by the current tick in milliseconds
+        '''
+        if cls._step is not None:
+            return cls._step
+        return cls._clock.get_time()
+
+    @property
+    def events(cls):
+        '''
+        produce the event router
+        '''
+        return cls._events
+
+    @property
+    def pacer(cls):
+        '''
+        produce the frame pacer
+        '''
+        return cls._pacer
+
+    @property
+    def profiler(cls):
+        '''
+        produce the frame profiler
+        '''
+        return cls._profiler
+
+    @property
+    def max_fps(cls):
+        '''
+        produce the frame rate limit
+        '''
+        return cls._max_fps
+
+    @property
+    def first_frame(cls):
+        '''
+        produce the time from startup to the first presented frame in
+        milliseconds, or None before it was presented
+        '''
+        return cls._first_frame
+
     @property
     def screen(cls):
         '''
@@ -31,6 +94,20 @@ class MetaGame(type):
         '''
         cls._screen = value
 
+    @property
+    def audio(cls):
+        '''
+        get the audio manager
+        '''
+        return cls._audio
+
+    @audio.setter
+    def audio(cls, value):
+        '''
+        set the audio manager
+        '''
+        cls._audio = value
+
     @property
     def scenes(cls):
         '''
@@ -51,16 +128,32 @@ class Game(object, metaclass=MetaGame):
     manage the pygame screen
     '''
     _clock = None
+    _events = None
+    _pacer = None
+    _profiler = None
     _screen = None
     _scenes = None
+    _audio = None
 
     _fps_unlocked = False
     _max_fps = 0
+    _first_frame = None
+    _step = None
+    _idle = False
+    _running = False
 
     @classmethod
-    def init(cls, title='pygame', max_fps=0):
+    def init(cls, title='pygame', max_fps=0, profile_dump=None, tick_rate=0, idle=False,
+             spin=0.0):
         '''
         initialize pygame and some other important things
+
+        if profile_dump is given, per-phase frame times are written there.
+        if tick_rate is given, scenes are ticked at that fixed rate no matter
+        the frame rate, otherwise they are ticked once per frame. if idle is
+        True, the loop blocks on events while the scene has nothing to draw.
+        spin is the time in seconds the frame pacer busy waits before each
+        deadline, see FramePacer.
         '''
         # initialize pygame
         pygame.mixer.pre_init(channels=1)
@@ -72,39 +165,145 @@ class Game(object, metaclass=MetaGame):
         # initialize game clock
         cls._clock = pygame.time.Clock()
         cls._max_fps = max_fps
+        cls._pacer = FramePacer(max_fps, spin)
+
+        # initialize the event router with the game wide handlers
+        cls._events = EventRouter()
+        cls._events.register(pygame.QUIT, cls._on_quit)
+        cls._events.register(pygame.VIDEORESIZE, cls._on_resize)
+        cls._events.register(pygame.KEYUP, cls._on_toggle_debug, key=pygame.K_HASH)
+        cls._events.register(pygame.KEYUP, cls._on_toggle_fps, key=pygame.K_EXCLAIM)
+
+        # initialize the simulation timestep
+        cls._step = 1000.0 / tick_rate if tick_rate else None
+        cls._idle = idle
+
+        # initialize the frame profiler
+        cls._profiler = FrameProfiler(dump=profile_dump)
 
     @classmethod
     def main(cls):
         '''
         start the main loop of the game
         '''
-        while cls._scenes:
-            # get the scene on top of the scene stack
-            scene = cls._scenes.peek()
+        try:
+            cls._loop()
+        finally:
+            cls._profiler.close()
+
+    @classmethod
+    def _loop(cls):
+        '''
+        run frames until the scene stack is empty or the game is closed
+        '''
+        profiler = cls._profiler
+        events = []
+        lag = 0.0
+        cls._running = True
+
+        while cls._scenes and cls._running:
+            profiler.begin()
 
             try:
-                # process events
-                for event in pygame.event.get():
-                    if event.type == pygame.QUIT:
-                        return
-                    elif event.type == pygame.VIDEORESIZE:
-                        cls.screen.resize(event.dict['size'])
-                    elif event.type == pygame.KEYUP and event.key == pygame.K_HASH:
-                        cls.screen.debug.enabled = not cls.screen.debug.enabled
-                    elif event.type == pygame.KEYUP and event.key == pygame.K_EXCLAIM:
-                        cls._fps_unlocked = not cls._fps_unlocked
-                    else:
-                        scene.on_event(event)
-
-                # update the scenegraph objects and redraw
-                scene.update()
+                # complete background scene loads and get the scene on top,
+                # scenes that failed to construct are dropped
+                cls._scenes.poll()
+                scene = cls._scenes.peek()
+                if scene is None:
+                    continue
+                if scene is not cls._events.scene:
+                    # the cursor follows mouse motion even while idle
+                    cursor = (pygame.MOUSEMOTION,) if cls.screen.cursor.visible else ()
+                    cls._events.activate(scene, cursor)
+
+                # process events, including one that ended an idle wait
+                cls._events.dispatch(events + pygame.event.get())
+                events = []
+                profiler.mark('events')
+
+                # advance the scene once, or in fixed steps for the elapsed time
+                if cls._step is None:
+                    scene.tick()
+                else:
+                    lag = min(lag + cls._clock.get_time(), _MAX_LAG)
+                    while lag >= cls._step:
+                        scene.tick()
+                        lag -= cls._step
+                if cls._audio is not None:
+                    cls._audio.feed()
+                profiler.mark('update')
+
+                # redraw the scenegraph objects
+                scene.render()
 
                 # flip the buffers at the given maximum refresh rate
                 cls.screen.flip()
-                cls._clock.tick(0 if cls._fps_unlocked else cls._max_fps)
+                if cls._first_frame is None:
+                    cls._first_frame = (perf_counter() - _STARTED) * 1000
+                if cls._idle and cls._running:
+                    events = cls._wait_idle(scene, lag)
+                cls._pacer.wait(not cls._fps_unlocked)
+                cls._clock.tick()
+                profiler.mark('wait')
             except StopIteration:
                 Game.scenes.pop()
 
+            profiler.end()
+
+    @classmethod
+    def _on_quit(cls, _):
+        '''
+        leave the main loop after the current frame
+        '''
+        cls._running = False
+
+    @classmethod
+    def _on_resize(cls, event):
+        '''
+        resize the window
+        '''
+        cls.screen.resize(event.dict['size'])
+
+    @classmethod
+    def _on_toggle_debug(cls, _):
+        '''
+        toggle the debug overlay
+        '''
+        cls.screen.debug.enabled = not cls.screen.debug.enabled
+
+    @classmethod
+    def _on_toggle_fps(cls, _):
+        '''
+        toggle the frame rate limit
+        '''
+        cls._fps_unlocked = not cls._fps_unlocked
+
+    @classmethod
+    def _wait_idle(cls, scene, lag=0.0):
+        '''
+        block until an event arrives or the scene needs its next update
+
+        lag is the elapsed time not yet ticked, it counts towards the wait.
+        produce the event that ended the wait as a list, for processing in
+        the next frame.
+        '''
+        if cls._scenes.pending:
+            return []
+
+        timeout = scene.idle_time()
+        if cls._audio is not None and cls._audio.streams:
+            # streams are fed once per frame
+            timeout = _STREAM_TIMEOUT if timeout is None else min(timeout, _STREAM_TIMEOUT)
+        timeout = _IDLE_TIMEOUT if timeout is None else min(timeout - lag, _IDLE_TIMEOUT)
+        period = 1000.0 / cls._pacer.max_fps if cls._pacer.max_fps else 0.0
+        if int(timeout) <= period:
+            # the frame rate limit waits as long anyway
+            return []
+
+        event = pygame.event.wait(int(timeout))
+        cls._pacer.resync()
+        return [] if event.type == pygame.NOEVENT else [event]
+
     @classmethod
     def quit(cls):
         '''
@@ -0,0 +1,97 @@
+'''
+This module provides precise frame pacing with jitter statistics
+'''
+
+import math
+import time
+from collections import deque
+
+
+class FramePacer(object):
+    '''
+    hold frames to a fixed schedule of 1/max_fps seconds
+
+    frames are scheduled against deadlines rather than the end of the
+    previous frame, so that waiting does not accumulate drift. the wait
+    sleeps until the deadline. sleeping alone overshoots by up to a
+    scheduler quantum, so with spin seconds given, it sleeps until that long
+    before the deadline and busy waits for the rest, at the cost of a core.
+    a frame that misses its deadline by more than a period restarts the
+    schedule.
+    '''
+    def __init__(self, max_fps=0, spin=0.0, window=300):
+        '''
+        constructor
+        '''
+        self._period = 1.0 / max_fps if max_fps else 0.0
+        self._spin = spin
+        self._deadline = None
+        self._last = None
+        self._intervals = deque(maxlen=window)
+
+    @property
+    def max_fps(self):
+        '''
+        produce the frame rate limit, 0 if unlimited
+        '''
+        return 1.0 / self._period if self._period else 0
+
+    def resync(self):
+        '''
+        restart the schedule, such as after blocking while idle
+
+        the next frame interval is not recorded in the statistics.
+        '''
+        self._deadline = None
+        self._last = None
+
+    def wait(self, limit=True):
+        '''
+        wait for the deadline of the next frame, if limit is True
+        '''
+        now = time.perf_counter()
+
+        if limit and self._period and self._deadline is not None:
+            if now < self._deadline - self._spin:
+                time.sleep(self._deadline - self._spin - now)
+            while self._spin and time.perf_counter() < self._deadline:
+                pass
+            now = time.perf_counter()
+
+        if self._last is not None:
+            self._intervals.append((now - self._last) * 1000)
+        self._last = now
+
+        if self._deadline is None or now - self._deadline > self._period:
+            self._deadline = now
+        self._deadline += self._period
+
+    @property
+    def intervals(self):
+        '''
+        produce the recent frame intervals in milliseconds
+        '''
+        return list(self._intervals)
+
+    @property
+    def jitter(self):
+        '''
+        produce the standard deviation of the recent frame intervals in
+        milliseconds
+        '''
+        count = len(self._intervals)
+        if count < 2:
+            return 0.0
+
+        mean = sum(self._intervals) / count
+        return math.sqrt(sum((i - mean) ** 2 for i in self._intervals) / (count - 1))
+
+    @property
+    def missed(self):
+        '''
+        produce the number of recent frames that took longer than a period
+        and a half
+        '''
+        if not self._period:
+            return 0
+        return sum(1 for i in self._intervals if i > self._period * 1500)
@@ -0,0 +1,93 @@
+'''
+This module provides a low overhead per-phase frame time profiler
+'''
+
+from collections import deque
+from time import perf_counter
+
+
+class FrameProfiler(object):
+    '''
+    time the phases of each frame and keep a rolling window of samples
+
+    a frame is framed by begin() and end(), and every mark(phase) attributes
+    the time since the previous mark to the given phase. marks outside of a
+    frame are ignored. if a dump path is given, every frame is also written
+    to that file as a line of comma separated milliseconds.
+    '''
+    PHASES = ('events', 'update', 'draw', 'overlay', 'scale', 'flip', 'wait')
+
+    def __init__(self, window=300, dump=None):
+        '''
+        constructor
+        '''
+        self._samples = deque(maxlen=window)
+        self._current = None
+        self._last = None
+
+        self._dump = None
+        if dump is not None:
+            self._dump = open(dump, 'w')
+            self._dump.write(','.join(('total',) + self.PHASES) + '\n')
+
+    def begin(self):
+        '''
+        start timing a frame
+        '''
+        self._current = dict.fromkeys(self.PHASES, 0.0)
+        self._last = perf_counter()
+
+    def mark(self, phase):
+        '''
+        attribute the time since the last mark to the given phase
+        '''
+        if self._last is None:
+            return
+
+        now = perf_counter()
+        self._current[phase] = self._current.get(phase, 0.0) + (now - self._last) * 1000
+        self._last = now
+
+    def end(self):
+        '''
+        finish timing a frame and store its sample
+        '''
+        if self._last is None:
+            return
+
+        sample = (sum(self._current.values()), self._current)
+        self._samples.append(sample)
+        self._last = None
+
+        if self._dump is not None:
+            self._dump.write(','.join(
+                '%.3f' % value
+                for value in (sample[0],) + tuple(sample[1][p] for p in self.PHASES)) + '\n')
+
+    @property
+    def totals(self):
+        '''
+        produce the total frame times in the window in milliseconds
+        '''
+        return [total for (total, _) in self._samples]
+
+    def percentile(self, fraction, phase=None):
+        '''
+        produce a percentile of the frame time, or of one phase, in milliseconds
+        '''
+        if not self._samples:
+            return 0.0
+
+        if phase is None:
+            values = sorted(self.totals)
+        else:
+            values = sorted(phases[phase] for (_, phases) in self._samples)
+        return values[min(len(values) - 1, int(fraction * len(values)))]
+
+    def close(self):
+        '''
+        flush and close the dump file, if any
+        '''
+        if self._dump is not None:
+            self._dump.close()
+            self._dump = None
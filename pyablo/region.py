@@ -0,0 +1,81 @@
+'''
+This module provides coalescing of dirty rects into few non-redundant regions
+'''
+
+from pygame import Rect
+
+
+def _touching(first, second):
+    '''
+    check whether two rects overlap or share an edge, corners do not count
+    '''
+    x_touch = first.left <= second.right and second.left <= first.right
+    y_touch = first.top <= second.bottom and second.top <= first.bottom
+    x_overlap = first.left < second.right and second.left < first.right
+    y_overlap = first.top < second.bottom and second.top < first.bottom
+    return (x_touch and y_overlap) or (x_overlap and y_touch)
+
+
+def merge(rects):
+    '''
+    merge overlapping and adjacent rects into their bounding boxes
+
+    rects without area are dropped. the result contains no two rects that
+    overlap or touch each other.
+    '''
+    merged = [Rect(rect) for rect in rects if rect.width > 0 and rect.height > 0]
+
+    # a merge can make a box touch rects it was already compared with
+    changed = True
+    while changed:
+        changed = False
+        merged.sort(key=lambda rect: rect.left)
+
+        result = []
+        for rect in merged:
+            for other in reversed(result):
+                if _touching(rect, other):
+                    other.union_ip(rect)
+                    changed = True
+                    break
+            else:
+                result.append(rect)
+        merged = result
+
+    return merged
+
+
+def tiles(rects, size):
+    '''
+    produce the grid tiles of the given size covered by any of the rects
+    '''
+    covered = set()
+    for rect in rects:
+        for y in range(rect.top // size, (rect.bottom - 1) // size + 1):
+            for x in range(rect.left // size, (rect.right - 1) // size + 1):
+                covered.add((x, y))
+
+    return merge(Rect(x * size, y * size, size, size) for (x, y) in covered)
+
+
+def coalesce(rects, bounds=None, limit=16, tile=64):
+    '''
+    reduce the given dirty rects to a bounded number of regions
+
+    overlapping and adjacent rects are merged first. if more than limit
+    regions remain, the damage is snapped to a grid of tile sized cells, and
+    if that still does not help, the bounding box of all rects is used. the
+    result is clipped to bounds if given.
+    '''
+    result = merge(rects)
+
+    if len(result) > limit:
+        result = tiles(result, tile)
+    if len(result) > limit:
+        result = [result[0].unionall(result[1:])]
+
+    if bounds is not None:
+        result = [rect.clip(bounds) for rect in result]
+        result = [rect for rect in result if rect.width > 0 and rect.height > 0]
+
+    return result
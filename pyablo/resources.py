@@ -2,13 +2,86 @@
 This module provides game resource handling used by pyablo
 '''
 
-import mpq
+import contextlib
+import io
+import logging
+import struct
+import threading
+from concurrent.futures import ThreadPoolExecutor
+import pygame
+from pyablo.blocktable import BlockTable
+from pyablo.cache import ResourceCache
+from pyablo.diskcache import DiskCache, fingerprint
+from pyablo.framestore import FrameStore, transcode
 from pyablo.drawables import Video, Image, AnimatedImage
 
 
 _ERROR_UNITIALIZED = 'Resources.open called, but resource store uninitialized.'
 _ERROR_OPEN_FAILED = 'unable to open resources file - incomplete installation?'
 
+_LOG = logging.getLogger(__name__)
+
+# worker threads shared by all prefetches to decode images
+_PREFETCH_WORKERS = 4
+
+
+class ArchiveFile(object):
+    '''
+    a file of the resource archive that is read under the archive lock
+
+    the archive is not safe to use from several threads at once, while its
+    files are read by decoder threads, background transcodes and scenes
+    constructed on the thread pool of the scene stack.
+    '''
+    def __init__(self, handle, lock):
+        '''
+        constructor - wrap a file-like object produced by the archive
+        '''
+        self._handle = handle
+        self._lock = lock
+
+    def read(self, *args):
+        '''
+        read from the file
+        '''
+        with self._lock:
+            return self._handle.read(*args)
+
+    def seek(self, *args):
+        '''
+        move the file position
+        '''
+        with self._lock:
+            return self._handle.seek(*args)
+
+    def tell(self):
+        '''
+        produce the file position
+        '''
+        with self._lock:
+            return self._handle.tell()
+
+    def seekable(self):
+        '''
+        produce whether the file can seek, archive files always can
+        '''
+        return True
+
+    def readable(self):
+        '''
+        produce whether the file can be read, archive files always can
+        '''
+        return True
+
+    def close(self):
+        '''
+        close the file
+        '''
+        with self._lock:
+            close = getattr(self._handle, 'close', None)
+            if close is not None:
+                close()
+
 
 class Resource(object):
     '''
@@ -46,18 +119,18 @@ class Resource(object):
 
 _NAMED_RESOURCES = {
     # videos
-    'intro_logos.smk':          Resource('File00002910.smk', fps=15),
-    'intro_cinematic.smk':      Resource('File00001475.smk', fps=15),
+    'intro_logos.smk':          Resource('File00002910.smk', fps=15, stream=True, sync=True),
+    'intro_cinematic.smk':      Resource('File00001475.smk', fps=15, stream=True, sync=True),
     # images
     'cursor.pcx':               Resource('File00002905.pcx', colorkey=(0, -1)),
-    'glyph_xlarge_gold.pcx':    Resource('File00000017.pcx'),
-    'glyph_xlarge_grey.pcx':    Resource('File00000018.pcx'),
-    'glyph_large_gold.pcx':     Resource('File00000008.pcx'),
-    'glyph_large_grey.pcx':     Resource('File00000009.pcx'),
-    'glyph_medium_gold.pcx':    Resource('File00000011.pcx'),
-    'glyph_medium_grey.pcx':    Resource('File00000012.pcx'),
-    'glyph_small_gold.pcx':     Resource('File00000014.pcx'),
-    'glyph_small_grey.pcx':     Resource('File00000015.pcx'),
+    'glyph_xlarge_gold.pcx':    Resource('File00000017.pcx', colorkey=(0, 0)),
+    'glyph_xlarge_grey.pcx':    Resource('File00000018.pcx', colorkey=(0, 0)),
+    'glyph_large_gold.pcx':     Resource('File00000008.pcx', colorkey=(0, 0)),
+    'glyph_large_grey.pcx':     Resource('File00000009.pcx', colorkey=(0, 0)),
+    'glyph_medium_gold.pcx':    Resource('File00000011.pcx', colorkey=(0, 0)),
+    'glyph_medium_grey.pcx':    Resource('File00000012.pcx', colorkey=(0, 0)),
+    'glyph_small_gold.pcx':     Resource('File00000014.pcx', colorkey=(0, 0)),
+    'glyph_small_grey.pcx':     Resource('File00000015.pcx', colorkey=(0, 0)),
     'intro_splash.pcx':         Resource('File00000000.pcx'),
     'logo_flames_large.pcx':    Resource('File00000019.pcx', colorkey=(0, 0), fps=20, count=15),
     'logo_flames_medium.pcx':   Resource('File00000022.pcx', colorkey=(0, 0), fps=20, count=15),
@@ -71,26 +144,63 @@ class Resources(object):
     Resource management static class
     '''
     _mpq = None
+    _blocks = None
+    _disk = None
+    _transcoding = set()
+    _lock = threading.RLock()
+    _executor = None
+    _recording = threading.local()
+    cache = ResourceCache()
 
     @classmethod
-    def load(cls, path):
+    def load(cls, path, cache_dir=None):
         '''
         Load the game resources from the mpq file
+
+        if a cache directory is given, decoded images are kept there across
+        launches, keyed by the fingerprint of the archive.
         '''
+        import mpq
+
         try:
-            cls._mpq = mpq.MPQFile(path)
+            archive = mpq.MPQFile(path)
         except OSError as ex:
             raise OSError(_ERROR_OPEN_FAILED) from ex
 
+        disk = None
+        if cache_dir is not None:
+            disk = DiskCache(cache_dir, fingerprint(path))
+        cls.mount(archive, disk)
+
+        # the archive does not tell where its files are, prefetch reads them
+        # in manifest order if the block table cannot be read either
+        try:
+            cls._blocks = BlockTable(path)
+        except (OSError, ValueError, struct.error):
+            _LOG.warning('unable to read the block table of %s', path)
+
+    @classmethod
+    def mount(cls, archive, disk=None):
+        '''
+        use the given archive as resource store
+
+        the archive is anything providing open(name) that produces file-like
+        objects, such as an mpq.MPQFile or a fixture archive for benchmarks.
+        the optional disk cache holds decoded images of that archive.
+        '''
+        cls._mpq = archive
+        cls._blocks = None
+        cls._disk = disk
+
     @classmethod
     def _open(cls, name):
         '''
         produce a resource from the given name
         '''
-        try:
-            return cls._mpq.open(name)
-        except AttributeError as ex:
-            raise ValueError(_ERROR_UNITIALIZED) from ex
+        if cls._mpq is None:
+            raise ValueError(_ERROR_UNITIALIZED)
+        with cls._lock:
+            return ArchiveFile(cls._mpq.open(name), cls._lock)
 
     @classmethod
     def fopen(cls, name):
@@ -100,18 +210,204 @@ class Resources(object):
         resource = _NAMED_RESOURCES.get(name, Resource(name))
         return cls._open(resource.name)
 
+    @classmethod
+    def _offset(cls, name):
+        '''
+        produce the position of a file in the archive, or None
+
+        archives tell the position through offset(name), for mpq archives it
+        is looked up in their block table. without either, files are read in
+        manifest order.
+        '''
+        offset = getattr(cls._mpq, 'offset', None)
+        if offset is not None:
+            with cls._lock:
+                return offset(name)
+        if cls._blocks is not None:
+            return cls._blocks.offset(name)
+        return None
+
+    @staticmethod
+    def _prefetchable(resource):
+        '''
+        check whether a resource holds decoded data that prefetch caches
+        '''
+        return resource.name.endswith('.pcx')
+
+    @classmethod
+    def _pool(cls):
+        '''
+        produce the worker threads decoding prefetched images
+        '''
+        with cls._lock:
+            if cls._executor is None:
+                cls._executor = ThreadPoolExecutor(max_workers=_PREFETCH_WORKERS)
+            return cls._executor
+
+    @classmethod
+    def _decode(cls, name, data=None):
+        '''
+        produce the decoded image of the given archive file as a surface
+
+        images are mapped from the disk cache if possible, and decoded from
+        the archive and written to the disk cache otherwise. the contents of
+        the file are read from the archive unless data is given.
+        '''
+        surface = None
+        if cls._disk is not None:
+            surface = cls._disk.load(name)
+
+        if surface is None:
+            surface = pygame.image.load(cls._open(name) if data is None else io.BytesIO(data))
+            if cls._disk is not None:
+                cls._disk.store(name, surface)
+
+        return Image.prepare(surface)
+
+    @classmethod
+    def _frame_store(cls, name):
+        '''
+        produce the frame store of the given video file, or None
+
+        with a disk cache, videos without a frame store are transcoded into
+        one in the background, so that later playbacks map the store instead
+        of decoding the video again.
+        '''
+        if cls._disk is None:
+            return None
+
+        path = cls._disk.path(name, '.frames')
+        try:
+            return FrameStore(path)
+        except (OSError, ValueError):
+            pass
+
+        if name not in cls._transcoding:
+            cls._transcoding.add(name)
+            threading.Thread(target=cls._transcode, args=(name, path), daemon=True).start()
+        return None
+
+    @classmethod
+    def _transcode(cls, name, path):
+        '''
+        transcode the given video file into a frame store at path
+        '''
+        try:
+            transcode(cls._open(name), path)
+        except Exception:  # pylint: disable=broad-except
+            # the store is an optimization, the video still plays streamed
+            _LOG.exception('unable to transcode %s into a frame store', name)
+
+    @classmethod
+    def _key(cls, resource):
+        '''
+        produce the cache key of the given resource
+        '''
+        return (resource.name, resource.args, tuple(sorted(resource.kwargs.items())))
+
+    @classmethod
+    def _build(cls, resource, data=None):
+        '''
+        produce the image drawable of a resource, decoded into the cache
+        '''
+        drawable = AnimatedImage if 'fps' in resource.kwargs else Image
+        result = drawable(cls._decode(resource.name, data), *resource.args, **resource.kwargs)
+        cls.cache.put(cls._key(resource), result.source)
+        return result
+
+    @classmethod
+    def prefetch(cls, manifest):
+        '''
+        decode the images of a manifest of resource names into the cache
+
+        the files are read in the order of their offsets in the archive, see
+        _offset, so that loading a scene is one sequential pass over it, and
+        decoded on a shared pool of worker threads while the reads go on.
+        images in the disk cache are mapped instead of read. names that are
+        cached already, or hold no decoded data worth caching, are skipped.
+        '''
+        resources = dict()
+        for name in manifest:
+            resource = _NAMED_RESOURCES.get(name, Resource(name))
+            key = cls._key(resource)
+            if cls._prefetchable(resource) and key not in cls.cache:
+                resources[key] = resource
+
+        reads = []
+        for (position, resource) in enumerate(resources.values()):
+            stored = cls._disk is not None and resource.name in cls._disk
+            offset = None if stored else cls._offset(resource.name)
+            reads.append(((offset is None, offset or 0, position), resource, stored))
+        reads.sort(key=lambda read: read[0])
+
+        executor = cls._pool()
+        futures = [
+            executor.submit(
+                cls._build, resource, None if stored else cls._open(resource.name).read())
+            for (_, resource, stored) in reads]
+        for future in futures:
+            future.result()
+
+    @classmethod
+    @contextlib.contextmanager
+    def recording(cls):
+        '''
+        collect the names of the images opened by this thread within the
+        block into the produced set, such as those a manifest should list
+        '''
+        previous = getattr(cls._recording, 'names', None)
+        cls._recording.names = set()
+        try:
+            yield cls._recording.names
+        finally:
+            cls._recording.names = previous
+
+    @classmethod
+    def pin(cls, name):
+        '''
+        keep the decoded data of the named resource cached permanently
+        '''
+        cls.cache.pin(cls._key(_NAMED_RESOURCES.get(name, Resource(name))))
+
     @classmethod
     def open(cls, name):
         '''
         return the queried resource as a game object
+
+        decoded data is shared through the resource cache, so opening a
+        resource repeatedly decodes it only once while it stays cached.
         '''
         resource = _NAMED_RESOURCES.get(name, Resource(name))
-        data = cls._open(resource.name)
+
+        names = getattr(cls._recording, 'names', None)
+        if names is not None and cls._prefetchable(resource):
+            names.add(name)
 
         if resource.name.endswith('.smk'):
-            return Video(data, *resource.args, **resource.kwargs)
+            drawable = Video
         elif resource.name.endswith('.pcx'):
-            if 'fps' in resource.kwargs:
-                return AnimatedImage(data, *resource.args, **resource.kwargs)
-            return Image(data, *resource.args, **resource.kwargs)
-        return data
+            drawable = AnimatedImage if 'fps' in resource.kwargs else Image
+        else:
+            return cls._open(resource.name)
+
+        # streamed videos hold no decoded data worth sharing
+        if resource.kwargs.get('stream'):
+            store = cls._frame_store(resource.name)
+            if store is not None:
+                return Video(None, *resource.args, store=store, **resource.kwargs)
+            return Video(cls._open(resource.name), *resource.args, **resource.kwargs)
+
+        key = cls._key(resource)
+        shared = cls.cache.get(key)
+
+        if drawable is Video:
+            result = Video(
+                cls._open(resource.name), *resource.args, audio=shared, **resource.kwargs)
+        elif shared is not None:
+            return drawable(shared, *resource.args, **resource.kwargs)
+        else:
+            return cls._build(resource)
+
+        if shared is None:
+            cls.cache.put(key, result.source)
+        return result
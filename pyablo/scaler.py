@@ -0,0 +1,286 @@
+'''
+This module provides the scalers that map the frame buffer to the window
+'''
+
+import numpy
+import pygame
+
+
+class Scaler(object):
+    '''
+    scale with pygame.transform.scale
+
+    scalers map regions of a source surface in native resolution to the
+    covering regions of a destination surface in window resolution, so that
+    partial updates only touch the damaged pixels.
+    '''
+    def __init__(self):
+        '''
+        constructor
+        '''
+        self._src_size = (1, 1)
+        self._dst_size = (1, 1)
+
+    def resize(self, src_size, dst_size):
+        '''
+        prepare for scaling between the given sizes
+        '''
+        self._src_size = src_size
+        self._dst_size = dst_size
+
+    @property
+    def partial(self):
+        '''
+        produce whether regions scale to the same pixels as the full frame
+
+        that holds for integer scale factors only, at other factors the
+        damaged regions of a frame cannot be scaled on their own.
+        '''
+        return all(dst % src == 0 for (src, dst) in zip(self._src_size, self._dst_size))
+
+    def to_window(self, rect):
+        '''
+        map a source rect to the covering destination rect
+        '''
+        ((width, height), (scaled_width, scaled_height)) = (self._src_size, self._dst_size)
+
+        left = rect.left * scaled_width // width
+        top = rect.top * scaled_height // height
+        right = -(-rect.right * scaled_width // width)
+        bottom = -(-rect.bottom * scaled_height // height)
+        return pygame.Rect(left, top, right - left, bottom - top)
+
+    def to_native(self, rect):
+        '''
+        map a destination rect to the covering source rect
+        '''
+        ((width, height), (scaled_width, scaled_height)) = (self._src_size, self._dst_size)
+
+        left = rect.left * width // scaled_width
+        top = rect.top * height // scaled_height
+        right = -(-rect.right * width // scaled_width)
+        bottom = -(-rect.bottom * height // scaled_height)
+        return pygame.Rect(left, top, right - left, bottom - top)
+
+    def scale(self, src, dst, rect=None):
+        '''
+        scale the given region of src, or all of it, and produce the
+        destination rect that was written
+        '''
+        if rect is None:
+            rect = src.get_rect()
+        scaled = self.to_window(rect)
+
+        # NOTE: smoothscale is blocked by https://github.com/pygame/pygame/issues/339,
+        # BilinearScaler interpolates with numpy instead
+        pygame.transform.scale(src.subsurface(rect), scaled.size, dst.subsurface(scaled))
+        return scaled
+
+
+class NearestScaler(Scaler):
+    '''
+    scale by nearest neighbour with index maps precomputed on resize
+
+    every destination pixel is sampled from the same source pixel whether it
+    is scaled as part of a region or of the full frame, so partial updates
+    leave no seams at any scale factor.
+    '''
+    def __init__(self):
+        '''
+        constructor
+        '''
+        super(NearestScaler, self).__init__()
+
+        self._xmap = None
+        self._ymap = None
+
+    def resize(self, src_size, dst_size):
+        '''
+        rebuild the index maps for the given sizes
+        '''
+        super(NearestScaler, self).resize(src_size, dst_size)
+
+        self._xmap = numpy.arange(dst_size[0]) * src_size[0] // dst_size[0]
+        self._ymap = numpy.arange(dst_size[1]) * src_size[1] // dst_size[1]
+
+    @property
+    def partial(self):
+        '''
+        produce True, the index maps do not depend on the scaled region
+        '''
+        return True
+
+    @staticmethod
+    def _compatible(src, dst):
+        '''
+        check whether pixels can be copied between the surfaces verbatim
+
+        pixels2d only maps 16 and 32 bit surfaces without copying, 8 bit ones
+        would need the same palette as well.
+        '''
+        return (src.get_bitsize() == dst.get_bitsize() and src.get_bitsize() in (16, 32) and
+                src.get_masks() == dst.get_masks())
+
+    def scale(self, src, dst, rect=None):
+        '''
+        scale the given region of src, or all of it, through the index maps
+        '''
+        if not self._compatible(src, dst):
+            return super(NearestScaler, self).scale(src, dst, rect)
+
+        if rect is None:
+            rect = src.get_rect()
+        scaled = self.to_window(rect)
+
+        # work on rows, the contiguous axis of the pixel arrays
+        source = pygame.surfarray.pixels2d(src).T
+        target = pygame.surfarray.pixels2d(dst).T
+        columns = source.take(self._xmap[scaled.left:scaled.right], axis=1)
+        target[scaled.top:scaled.bottom, scaled.left:scaled.right] = columns.take(
+            self._ymap[scaled.top:scaled.bottom], axis=0)
+        del source, target
+
+        return scaled
+
+
+class IntegerScaler(NearestScaler):
+    '''
+    scale by pixel replication if the window is an integer multiple of the
+    frame, and like NearestScaler otherwise
+    '''
+    def __init__(self):
+        '''
+        constructor
+        '''
+        super(IntegerScaler, self).__init__()
+
+        self._factor = None
+
+    def resize(self, src_size, dst_size):
+        '''
+        determine the integer scaling factor, if any
+        '''
+        super(IntegerScaler, self).resize(src_size, dst_size)
+
+        self._factor = None
+        if (dst_size[0] % src_size[0] == 0 and
+                dst_size[0] * src_size[1] == dst_size[1] * src_size[0]):
+            self._factor = dst_size[0] // src_size[0]
+
+    def scale(self, src, dst, rect=None):
+        '''
+        replicate each pixel of the given region factor times in both axes
+        '''
+        if self._factor is None or not self._compatible(src, dst):
+            return super(IntegerScaler, self).scale(src, dst, rect)
+
+        if rect is None:
+            rect = src.get_rect()
+        scaled = self.to_window(rect)
+        factor = self._factor
+
+        # widen the rows of the region once, then copy each of them factor times
+        source = pygame.surfarray.pixels2d(src).T
+        target = pygame.surfarray.pixels2d(dst).T
+        rows = source[rect.top:rect.bottom, rect.left:rect.right].repeat(factor, axis=1)
+        region = target[scaled.top:scaled.bottom, scaled.left:scaled.right]
+        for offset in range(factor):
+            region[offset::factor] = rows
+        del source, target, region
+
+        return scaled
+
+
+class BilinearScaler(NearestScaler):
+    '''
+    scale by bilinear interpolation with sample maps precomputed on resize
+
+    the bytes of 32 bit pixels are interpolated in 8 bit fixed point, other
+    frames are scaled like NearestScaler.
+    '''
+    def __init__(self):
+        '''
+        constructor
+        '''
+        super(BilinearScaler, self).__init__()
+
+        self._xmaps = None
+        self._ymaps = None
+
+    def resize(self, src_size, dst_size):
+        '''
+        rebuild the sample positions and weights for the given sizes
+        '''
+        super(BilinearScaler, self).resize(src_size, dst_size)
+
+        self._xmaps = self._axis(src_size[0], dst_size[0])
+        self._ymaps = self._axis(src_size[1], dst_size[1])
+
+    @property
+    def partial(self):
+        '''
+        produce False, interpolation samples beyond the edges of a region
+        '''
+        return False
+
+    @staticmethod
+    def _axis(size, scaled_size):
+        '''
+        produce the lower and upper samples and the upper weights of an axis
+        '''
+        centers = (numpy.arange(scaled_size) + 0.5) * size / scaled_size - 0.5
+        centers = numpy.clip(centers, 0, size - 1)
+        lower = numpy.floor(centers).astype(numpy.intp)
+        upper = numpy.minimum(lower + 1, size - 1)
+        weights = numpy.round((centers - lower) * 256).astype(numpy.uint16)
+        return (lower, upper, weights)
+
+    @staticmethod
+    def _blend(lower, upper, weights):
+        '''
+        interpolate between two arrays of bytes by weights out of 256
+        '''
+        blended = lower.astype(numpy.uint16) * (256 - weights)
+        blended += upper * weights
+        blended += 128
+        return (blended >> 8).astype(numpy.uint8)
+
+    def scale(self, src, dst, rect=None):
+        '''
+        interpolate the given region of src, or all of it
+        '''
+        if not self._compatible(src, dst) or src.get_bitsize() != 32:
+            return super(BilinearScaler, self).scale(src, dst, rect)
+
+        if rect is None:
+            rect = src.get_rect()
+        scaled = self.to_window(rect)
+
+        (x0, x1, wx) = (m[scaled.left:scaled.right] for m in self._xmaps)
+        (y0, y1, wy) = (m[scaled.top:scaled.bottom] for m in self._ymaps)
+
+        # interpolate the needed source rows horizontally, then vertically,
+        # on the bytes of the pixels, all channels alike
+        (first, last) = (y0[0], y1[-1] + 1)
+        source = pygame.surfarray.pixels2d(src).T[first:last]
+        rows = self._blend(source.take(x0, axis=1).view(numpy.uint8),
+                           source.take(x1, axis=1).view(numpy.uint8),
+                           wx.repeat(4))
+        del source
+
+        pixels = self._blend(rows.take(y0 - first, axis=0), rows.take(y1 - first, axis=0),
+                             wy[:, None])
+
+        target = pygame.surfarray.pixels2d(dst).T
+        target[scaled.top:scaled.bottom, scaled.left:scaled.right] = pixels.view(numpy.uint32)
+        del target
+
+        return scaled
+
+
+SCALERS = {
+    'transform': Scaler,
+    'nearest': NearestScaler,
+    'integer': IntegerScaler,
+    'bilinear': BilinearScaler,
+}
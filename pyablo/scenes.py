@@ -5,18 +5,38 @@ This module defines the scenes used in pyablo
 import pygame
 from pyablo.resources import Resources
 from pyablo.game import Game
+from pyablo.displaylist import DisplayList
+from pyablo.region import coalesce
 
 
 class Scene(object):
     '''
     a scene in the scene stack
+
+    EVENTS lists the event types on_event handles, other events are not
+    queued while the scene is active. None subscribes to all events.
+
+    MANIFEST lists the named resources the scene opens, they are prefetched
+    in one pass over the archive before the scene is constructed. images
+    opened by the constructor that are missing from it are logged.
     '''
+    EVENTS = None
+    MANIFEST = ()
+
     def __init__(self):
         '''
         constructor
         '''
         self._children = list()
+        self._cell_size = None
+        self._display = None
+        self._damage = []
+
+        # whether a drawable has a pending redraw, and the ticking drawables
+        self._dirty = False
+        self._ticks = 0
         self._cursor_visible = True
+        self._palette = None
 
     def on_event(self, event):
         '''
@@ -35,7 +55,9 @@ class Scene(object):
         invoke the resume callback if present
         '''
         Game.screen.cursor.visible = self._cursor_visible
+        Game.screen.palette = self._palette
         Game.screen.surface.fill((0, 0, 0))
+        Game.screen.invalidate()
 
         for child in self._children:
             child.redraw = True
@@ -52,48 +74,135 @@ class Scene(object):
         '''
         pass
 
+    def debug_info(self):
+        '''
+        produce additional lines of text for the debug overlay
+        '''
+        return []
+
+    def use_index(self, cell_size=64):
+        '''
+        find the drawables to redraw through a spatial index
+        '''
+        self._cell_size = cell_size
+        self._display = None
+
+    def child_moved(self, drawable):
+        '''
+        update the spatial index of the display list after a drawable changed
+        its rect
+        '''
+        if self._display is not None:
+            self._display.move(drawable)
+
+    def mark_dirty(self):
+        '''
+        mark the scene as having drawables with pending redraws
+        '''
+        self._dirty = True
+
+    def count_ticks(self, delta):
+        '''
+        account for ticking drawables added to or removed from the scene
+        '''
+        self._ticks += delta
+
+    def graph_changed(self):
+        '''
+        rebuild the display list after drawables were added or removed
+        '''
+        self._display = None
+
     def add_child(self, drawable, pos=(0, 0)):
         '''
         add a drawable to the scenegraph
         '''
         drawable.rect.topleft = pos
         drawable.parent = self
-        drawable.redraw = 1
 
         self._children.append(drawable)
+        drawable.redraw = True
+        self.mark_dirty()
+        if drawable.ticks:
+            self.count_ticks(drawable.ticks)
+        self.graph_changed()
 
-    def update(self):
+    def remove_child(self, drawable):
         '''
-        update the scene
+        remove a drawable from the scenegraph, its region is redrawn
+        '''
+        self._children.remove(drawable)
+        drawable.parent = None
+        if drawable.ticks:
+            self.count_ticks(-drawable.ticks)
+        self._damage.extend(drawable.region())
+        self.graph_changed()
+
+    def tick(self):
+        '''
+        advance the scene and its drawables by Game.delta
         '''
         self.on_update()
+        if self._ticks:
+            for child in self._children:
+                if child.ticks:
+                    child.tick()
 
-        dirty = []
-        for child in self._children:
-            dirty.extend(child.update())
+    def idle_time(self):
+        '''
+        produce how long the scene can go without ticks in milliseconds, or
+        None if it only changes in response to events
+        '''
+        times = [child.idle_time() for child in self._children if child.ticks]
+        return min((t for t in times if t is not None), default=None)
+
+    def render(self):
+        '''
+        redraw the regions of the scene changed since the last render
+
+        the blits of all regions are taken from the display list and
+        submitted at once.
+        '''
+        dirty = self._damage
+        self._damage = []
+        if self._dirty:
+            self._dirty = False
+            for child in self._children:
+                if child.dirty:
+                    dirty.extend(child.update())
+        Game.profiler.mark('update')
 
-        for rect in dirty:
-            Game.screen.surface.fill((0, 0, 0), rect)
+        surface = Game.screen.surface
+        dirty = coalesce(dirty, surface.get_rect())
+        if self._display is None:
+            self._display = DisplayList(self._children, self._cell_size)
 
-        for child in self._children:
-            redraw = [rect.clip(child.rect) for rect in dirty if rect.collideswith(child.rect)]
-            child.draw(Game.screen.surface, redraw)
+        (blits, uncovered) = self._display.compile(dirty)
+        for rect in uncovered:
+            surface.fill((0, 0, 0), rect)
+        surface.blits(blits, doreturn=False)
+
+        Game.screen.invalidate(dirty)
+        Game.screen.debug.record_blits(blits)
+        Game.profiler.mark('draw')
 
 
 class CutScene(Scene):
     '''
     show the blizzard logos
     '''
+    EVENTS = (pygame.KEYUP, pygame.MOUSEBUTTONDOWN)
+
     def __init__(self, resource):
         '''
         constructor
         '''
         super(CutScene, self).__init__()
 
-        cutscene = Resources.open(resource)
-        cutscene.rect = cutscene.rect.fit(Game.screen.surface.get_rect())
+        self._cutscene = Resources.open(resource)
+        self._cutscene.rect = self._cutscene.rect.fit(Game.screen.surface.get_rect())
 
-        self.add_child(cutscene)
+        self.add_child(self._cutscene)
         self._cursor_visible = False
 
     def on_event(self, event):
@@ -112,13 +221,22 @@ class CutScene(Scene):
         '''
         super(CutScene, self).on_stop()
 
-        pygame.mixer.stop()
+        self._cutscene.close()
+
+    def debug_info(self):
+        '''
+        produce the playback statistics of the cutscene
+        '''
+        return ['video: %d dropped, %d late' % (self._cutscene.dropped, self._cutscene.late)]
 
 
 class IntroSplashScene(Scene):
     '''
     show the intro splash screen
     '''
+    EVENTS = (pygame.KEYUP, pygame.MOUSEBUTTONDOWN)
+    MANIFEST = ('intro_splash.pcx', 'logo_flames_large.pcx')
+
     def __init__(self):
         '''
         constructor
@@ -126,6 +244,7 @@ class IntroSplashScene(Scene):
         super(IntroSplashScene, self).__init__()
 
         background = Resources.open('intro_splash.pcx')
+        self._palette = background.palette
         background.add_child(Resources.open('logo_flames_large.pcx'), (45, 182))
 
         self.add_child(background)
@@ -160,11 +279,37 @@ class IntroSplashScene(Scene):
         if pygame.time.get_ticks() - self._timer_start > 10000:  # ms
             raise StopIteration
 
+    def idle_time(self):
+        '''
+        produce the time until the next animation frame or the timeout
+        '''
+        remaining = max(0, 10000 - (pygame.time.get_ticks() - self._timer_start))
+        drawables = super(IntroSplashScene, self).idle_time()
+        return remaining if drawables is None else min(remaining, drawables)
+
+
+class LoadingScene(Scene):
+    '''
+    show a blank screen while a slow scene is loading
+    '''
+    EVENTS = ()
+
+    def __init__(self):
+        '''
+        constructor
+        '''
+        super(LoadingScene, self).__init__()
+
+        self._cursor_visible = False
+
 
 class MainMenuScene(Scene):
     '''
     show the main menu
     '''
+    EVENTS = (pygame.KEYDOWN, pygame.MOUSEMOTION, pygame.MOUSEBUTTONDOWN)
+    MANIFEST = ('menu_background.pcx', 'logo_flames_medium.pcx')
+
     def __init__(self):
         '''
         constructor
@@ -172,6 +317,7 @@ class MainMenuScene(Scene):
         super(MainMenuScene, self).__init__()
 
         background = Resources.open('menu_background.pcx')
+        self._palette = background.palette
         background.add_child(Resources.open('logo_flames_medium.pcx'), (125, 0))
 
         self.add_child(background)
@@ -195,7 +341,16 @@ class MainMenuScene(Scene):
         super(MainMenuScene, self).on_update()
 
         if pygame.time.get_ticks() - self._timer_start > 20000:  # ms
-            Game.scenes.push('CutScene', args=('intro_cinematic.smk',))
+            Game.scenes.push('CutScene', args=('intro_cinematic.smk',), wait=False)
+            self._timer_start = pygame.time.get_ticks()
+
+    def idle_time(self):
+        '''
+        produce the time until the next animation frame or the idle timeout
+        '''
+        remaining = max(0, 20000 - (pygame.time.get_ticks() - self._timer_start))
+        drawables = super(MainMenuScene, self).idle_time()
+        return remaining if drawables is None else min(remaining, drawables)
 
     def on_resume(self):
         '''
@@ -3,51 +3,210 @@ This module provides management methods for the pygame screen
 '''
 
 import importlib
+import logging
+from collections import deque
+from concurrent.futures import ThreadPoolExecutor, wait
 from inspect import getmembers, isclass
 import pygame
 from pyablo.cursor import CursorOverlay
 from pyablo.debug import DebugOverlay
+from pyablo.game import Game
+from pyablo.region import coalesce
+from pyablo.resources import Resources
+from pyablo.scaler import SCALERS
+
+
+_LOG = logging.getLogger(__name__)
+
+
+class SceneFactory(object):
+    '''
+    a scene on the stack that is constructed when it first becomes the top
+    '''
+    def __init__(self, value, args=()):
+        '''
+        constructor
+        '''
+        self.value = value
+        self.args = tuple(args)
 
 
 class SceneStack(object):
     '''
     custom stack class for scenes
+
+    scenes can be constructed on a thread pool ahead of time with prefetch,
+    or pushed asynchronously with push(..., wait=False). asynchronous pushes
+    complete in poll, and if a load takes longer than loading_threshold
+    milliseconds, the scene named by loading is shown in the meantime.
+
+    scenes pushed with push(..., lazy=True) are kept as factories and only
+    constructed once they become the top of the stack, so that scenes queued
+    to be shown later do not load their resources up front.
+
+    the resources in the MANIFEST of a scene are prefetched right before
+    it is constructed, wherever that happens, and images the constructor
+    opens without them being listed are logged. a scene whose construction
+    fails is logged and dropped from the stack.
     '''
-    def __init__(self, module):
+    def __init__(self, module, loading=None, loading_threshold=250, workers=2):
         '''
         constructor
         '''
         self._scenedir = dict()
         self._stack = list()
 
+        self._executor = ThreadPoolExecutor(max_workers=workers)
+        self._prefetched = dict()
+        self._pending = deque()
+
+        self._loading = loading
+        self._loading_threshold = loading_threshold
+        self._loading_scene = None
+
         mod = importlib.import_module(module)
         for (name, value) in getmembers(mod, isclass):
             self._scenedir[name] = value
 
-    def push(self, value, args=()):
+    def prefetch(self, value, args=()):
+        '''
+        start constructing a scene in the background for a later push
+        '''
+        key = (value, tuple(args))
+        if key not in self._prefetched:
+            self._prefetched[key] = self._executor.submit(self._build, value, args)
+        return self._prefetched[key]
+
+    def _build(self, value, args):
+        '''
+        prefetch the manifest of a scene and construct it
+        '''
+        scene = self._scenedir[value]
+        manifest = getattr(scene, 'MANIFEST', ())
+        Resources.prefetch(manifest)
+
+        with Resources.recording() as opened:
+            result = scene(*args)
+        missing = opened.difference(manifest)
+        if missing:
+            _LOG.warning('MANIFEST of %s misses %s', value, ', '.join(sorted(missing)))
+        return result
+
+    def _construct(self, value, args):
+        '''
+        construct a scene, or finish its prefetched construction
+        '''
+        future = self._prefetched.pop((value, tuple(args)), None)
+        return future.result() if future is not None else self._build(value, args)
+
+    def push(self, value, args=(), wait=True, lazy=False):
         '''
         push to the stack and invoke callbacks
+
+        if wait is False, the scene is constructed in the background and
+        pushed by a later poll once it is ready. if lazy is True, the scene
+        is constructed once it is first peeked on top of the stack.
         '''
-        scene = self._scenedir[value](*args)
+        if lazy:
+            self._push(SceneFactory(value, args))
+            return
+
+        if not wait:
+            future = self._prefetched.pop((value, tuple(args)), None)
+            if future is None:
+                future = self._executor.submit(self._build, value, args)
+            self._pending.append((future, pygame.time.get_ticks(), value))
+            return
+
+        self._push(self._construct(value, args))
 
-        if self._stack:
+    def _push(self, scene):
+        '''
+        push a constructed scene or a factory and invoke callbacks
+        '''
+        if self._stack and not isinstance(self._stack[-1], SceneFactory):
             self._stack[-1].on_pause()
         self._stack.append(scene)
-        scene.on_resume()
+        if not isinstance(scene, SceneFactory):
+            scene.on_resume()
+
+    def poll(self):
+        '''
+        push scenes whose background construction has finished
+        '''
+        # with nothing to show, waiting for the load is all there is to do
+        if not self._stack and self._pending:
+            wait([self._pending[0][0]])
+
+        while self._pending and self._pending[0][0].done():
+            (future, _, value) = self._pending.popleft()
+            # the scene uncovered by the loading scene is resumed, in case
+            # the load failed and nothing is pushed over it
+            if self._loading_scene is not None:
+                if self._stack[-1] is self._loading_scene:
+                    self.pop()
+                else:
+                    self._stack.remove(self._loading_scene)
+                    self._loading_scene.on_stop()
+                self._loading_scene = None
+
+            try:
+                scene = future.result()
+            except Exception:  # pylint: disable=broad-except
+                _LOG.exception('unable to construct scene %s', value)
+                continue
+            self._push(scene)
+
+        if (self._pending and self._loading is not None and self._loading_scene is None and
+                pygame.time.get_ticks() - self._pending[0][1] > self._loading_threshold):
+            self._loading_scene = self._build(self._loading, ())
+            self._push(self._loading_scene)
+
+    @property
+    def pending(self):
+        '''
+        produce whether scenes are being constructed in the background
+        '''
+        return bool(self._pending)
 
     def peek(self):
         '''
-        peek on the stack
+        peek on the stack, constructing the scene on top if necessary
+
+        produce None if no scene is left once those failing to construct
+        are dropped
         '''
-        return self._stack[-1]
+        while self._stack:
+            top = self._stack[-1]
+            if not isinstance(top, SceneFactory):
+                return top
+
+            try:
+                scene = self._construct(top.value, top.args)
+            except Exception:  # pylint: disable=broad-except
+                _LOG.exception('unable to construct scene %s', top.value)
+                self.pop()
+                continue
+
+            self._stack[-1] = scene
+            scene.on_resume()
+            return scene
+        return None
 
     def pop(self):
         '''
         pop from the stack and invoke callbacks
+
+        the popped scene is stopped and released, scenes that were never
+        constructed are dropped without constructing them.
         '''
         scene = self._stack.pop()
-        scene.on_stop()
-        if self._stack:
+        if isinstance(scene, SceneFactory):
+            scene = None
+        else:
+            scene.on_stop()
+
+        if self._stack and not isinstance(self._stack[-1], SceneFactory):
             self._stack[-1].on_resume()
         return scene
 
@@ -55,25 +214,54 @@ class SceneStack(object):
         '''
         produce a boolean representation of the scene stack
         '''
-        return bool(self._stack)
+        return bool(self._stack) or bool(self._pending)
 
 
 class Screen(object):
     '''
     manage the pygame screen
+
+    with damage tracking enabled, only the regions invalidated since the last
+    flip are scaled and presented, and a frame without damage is skipped.
+
+    in paletted mode the frame buffer is an 8-bit surface with the palette of
+    the active scene, so that paletted images are blitted without conversion.
+    the frame is converted to the display format once, at presentation.
+
+    the scaler is one of the names in pyablo.scaler.SCALERS.
     '''
-    def __init__(self, size):
+    def __init__(self, size, damage_tracking=False, paletted=False, scaler='transform'):
         '''
         initialize pygame and most other important things
         '''
         # create a surface in native resolution as frame buffer
-        self._native_surface = pygame.surface.Surface(size)
+        self._paletted = paletted
+        if paletted:
+            self._native_surface = pygame.surface.Surface(size, 0, 8)
+        else:
+            self._native_surface = pygame.surface.Surface(size)
+        self._palette = None
+
+        # regions of the frame buffer changed since the last flip
+        self._damage_tracking = damage_tracking
+        self._damage = []
+        self._overlay_rects = []
+        self._cursor_rect = None
+
+        # running total of window pixels scaled and presented
+        self.presented = 0
 
         # initialize the window in native resolution if possible
+        self._scaler = SCALERS[scaler]()
         self._window = None
         self._window_surface = None
         self.resize(size)
 
+        # the frame buffer converted to display format for presentation
+        self._rgb_surface = None
+        if paletted:
+            self._rgb_surface = pygame.surface.Surface(size).convert()
+
         # initialize the cursor
         self._cursor = CursorOverlay()
         # initialize the debug overlay
@@ -86,6 +274,34 @@ class Screen(object):
         '''
         return self._native_surface
 
+    @property
+    def paletted(self):
+        '''
+        produce whether the frame buffer is paletted
+        '''
+        return self._paletted
+
+    @property
+    def palette(self):
+        '''
+        produce the palette of the frame buffer, or None if not paletted
+        '''
+        return self._palette
+
+    @palette.setter
+    def palette(self, value):
+        '''
+        set the palette of the frame buffer, if paletted
+        '''
+        if not self._paletted or value is None:
+            return
+
+        value = [tuple(colour)[:3] for colour in value]
+        if value != self._palette:
+            self._palette = value
+            self._native_surface.set_palette(value)
+            self.invalidate()
+
     @property
     def cursor(self):
         '''
@@ -100,6 +316,14 @@ class Screen(object):
         '''
         return self._debug
 
+    def invalidate(self, rects=None):
+        '''
+        mark regions of the frame buffer as changed, or all of it if None
+        '''
+        if rects is None:
+            rects = [self._native_surface.get_rect()]
+        self._damage.extend(rects)
+
     def resize(self, size):
         '''
         update the size of the window
@@ -113,22 +337,93 @@ class Screen(object):
         # create the a scaled subsurface for the window surface
         scaled = self._native_surface.get_rect().fit(self._window.get_rect())
         self._window_surface = self._window.subsurface(scaled)
+        self._scaler.resize(self._native_surface.get_size(), scaled.size)
+
+        self._cursor_rect = None
+        self.invalidate()
 
     def flip(self):
         '''
         map the surface to the window and flip the buffers
         '''
+        if self._damage_tracking:
+            self._flip_damaged()
+            return
+
+        self._damage.clear()
+
         # scale native surface to window surface
-        surface = self._native_surface.copy()
+        surface = self._compose([self._native_surface.get_rect()])
         self._debug.draw(surface)
+        Game.profiler.mark('overlay')
 
-        # NOTE: smoothscale is blocked by https://github.com/pygame/pygame/issues/339
-        pygame.transform.scale(
-            surface,
-            self._window_surface.get_size(),
-            self._window_surface)
+        self._cursor.restore(self._window_surface)
+        self._scaler.scale(surface, self._window_surface)
+        self.presented += self._window_surface.get_width() * self._window_surface.get_height()
 
-        self._cursor.draw(self._window_surface)
+        self._cursor_rect = self._cursor.draw(self._window_surface)
+        Game.profiler.mark('scale')
 
         # swap buffers and to next frame
         pygame.display.flip()
+        Game.profiler.mark('flip')
+
+    def _compose(self, rects):
+        '''
+        produce a surface in display format with the given regions of the
+        frame buffer up to date, that the debug overlay can be drawn on
+        '''
+        if self._paletted:
+            for rect in rects:
+                self._rgb_surface.blit(self._native_surface, rect, rect)
+            return self._rgb_surface
+
+        if self._debug.enabled:
+            return self._native_surface.copy()
+        return self._native_surface
+
+    def _flip_damaged(self):
+        '''
+        scale and present only the damaged regions of the frame buffer, or
+        the full frame if the scaler cannot scale regions on their own
+        '''
+        bounds = self._native_surface.get_rect()
+        offset = self._window_surface.get_abs_offset()
+
+        # the overlay of the last frame has to be erased in any case
+        damage = self._damage + self._overlay_rects
+        self._damage = []
+
+        cursor_rect = self._cursor.locate(self._window_surface)
+        if not damage and not self._debug.enabled and cursor_rect == self._cursor_rect:
+            return
+
+        # erase the software cursor from the window before scaling over it
+        updates = []
+        restored = self._cursor.restore(self._window_surface)
+        if restored is not None:
+            updates.append(restored.move(offset))
+
+        damage = coalesce(damage, bounds)
+        surface = self._compose(damage)
+
+        self._overlay_rects = []
+        if self._debug.enabled:
+            self._overlay_rects = self._debug.draw(surface)
+            damage.extend(self._overlay_rects)
+        Game.profiler.mark('overlay')
+
+        # scalers that cannot scale regions on their own scale the full frame
+        regions = coalesce(damage, bounds) if self._scaler.partial else [bounds]
+        for rect in regions:
+            scaled = self._scaler.scale(surface, self._window_surface, rect)
+            updates.append(scaled.move(offset))
+            self.presented += scaled.width * scaled.height
+
+        self._cursor_rect = self._cursor.draw(self._window_surface)
+        if self._cursor_rect is not None:
+            updates.append(self._cursor_rect.move(offset))
+        Game.profiler.mark('scale')
+
+        pygame.display.update(updates)
+        Game.profiler.mark('flip')
@@ -0,0 +1,89 @@
+'''
+This module provides a spatial index to find drawables by screen region
+'''
+
+import itertools
+
+
+class SpatialGrid(object):
+    '''
+    a uniform grid of cells mapping screen regions to the items covering them
+
+    items are scene graph nodes with a rect attribute. queries produce items
+    in insertion order, which is the drawing order of the children of a node.
+    '''
+    def __init__(self, cell_size=64):
+        '''
+        constructor
+        '''
+        self._cell_size = cell_size
+        self._cells = dict()
+        self._items = dict()
+        self._counter = itertools.count()
+
+    def _cells_of(self, rect):
+        '''
+        produce the grid cells covered by the given rect
+        '''
+        if rect.width <= 0 or rect.height <= 0:
+            return []
+
+        size = self._cell_size
+        return [
+            (x, y)
+            for y in range(rect.top // size, (rect.bottom - 1) // size + 1)
+            for x in range(rect.left // size, (rect.right - 1) // size + 1)]
+
+    def insert(self, item, rect):
+        '''
+        add an item covering the given rect
+        '''
+        if item in self._items:
+            self.move(item, rect)
+            return
+
+        cells = self._cells_of(rect)
+        self._items[item] = (next(self._counter), cells)
+        for cell in cells:
+            self._cells.setdefault(cell, set()).add(item)
+
+    def move(self, item, rect):
+        '''
+        update the rect covered by an item, keeping its order
+        '''
+        (order, cells) = self._items[item]
+        new_cells = self._cells_of(rect)
+
+        for cell in cells:
+            self._cells[cell].discard(item)
+            if not self._cells[cell]:
+                del self._cells[cell]
+        for cell in new_cells:
+            self._cells.setdefault(cell, set()).add(item)
+
+        self._items[item] = (order, new_cells)
+
+    def order(self, item):
+        '''
+        produce the sort key of an item, its insertion order
+        '''
+        return self._items[item][0]
+
+    def query(self, rects):
+        '''
+        produce the items covering any of the given rects, in insertion order
+        '''
+        found = set()
+        for rect in rects:
+            for cell in self._cells_of(rect):
+                for item in self._cells.get(cell, ()):
+                    if item.rect.colliderect(rect):
+                        found.add(item)
+
+        return sorted(found, key=self.order)
+
+    def __len__(self):
+        '''
+        produce the number of indexed items
+        '''
+        return len(self._items)
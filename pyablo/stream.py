@@ -0,0 +1,462 @@
+'''
+This module provides background decoding of cutscenes into bounded buffers
+'''
+
+import threading
+from collections import deque
+import numpy
+import pygame
+from pyablo import audio
+
+
+class FrameConverter(object):
+    '''
+    convert the decoded frames of one video stream into pixel arrays
+
+    the conversion context of rgb24 frames and the palette of pal8 frames
+    are kept between frames, a palette is only converted again once it
+    changed.
+    '''
+    def __init__(self):
+        '''
+        constructor
+        '''
+        # pyav is only needed once a video is actually played
+        from av.video.reformatter import VideoReformatter
+
+        self._reformatter = VideoReformatter()
+        self._palette = None
+        self._colours = None
+
+    def pal8_planes(self, frame, out=None):
+        '''
+        produce the palette indices and the palette of a pal8 frame
+
+        the indices are copied into out if given, or into a new array.
+        '''
+        plane = frame.planes[0]
+        indices = numpy.frombuffer(plane, numpy.uint8).reshape(
+            frame.height, plane.line_size)[:, :frame.width]
+        if out is None:
+            out = indices.copy()
+        else:
+            out[...] = indices
+
+        # the palette plane holds 256 native endian argb words
+        palette = bytes(frame.planes[1])
+        if palette != self._palette:
+            colours = numpy.frombuffer(palette, numpy.uint8).reshape(256, 4)[:, 2::-1]
+            self._palette = palette
+            self._colours = [tuple(colour) for colour in colours.tolist()]
+        return (out, self._colours)
+
+    def rgb24_view(self, frame):
+        '''
+        produce the pixels of a frame converted to rgb24 as a (height, width, 3)
+        view of the converted frame, without copying them into a new array
+        '''
+        plane = self._reformatter.reformat(frame, format='rgb24').planes[0]
+        rows = numpy.frombuffer(plane, numpy.uint8).reshape(frame.height, plane.line_size)
+        return rows[:, :frame.width * 3].reshape(frame.height, frame.width, 3)
+
+
+class FramePool(object):
+    '''
+    recycle frame sized arrays between a producer and a consumer
+
+    the consumer gives arrays back once it is done with them, so that a
+    steady stream of frames allocates no new arrays. arrays are only
+    allocated while the pool is empty, and allocated counts them.
+    '''
+    def __init__(self):
+        '''
+        constructor
+        '''
+        self._free = deque()
+        self.allocated = 0
+
+    def take(self, shape, dtype=numpy.uint8):
+        '''
+        produce an array of the given shape, recycled if possible
+        '''
+        try:
+            array = self._free.pop()
+        except IndexError:
+            array = None
+
+        if array is None or array.shape != shape or array.dtype != dtype:
+            self.allocated += 1
+            array = numpy.empty(shape, dtype)
+        return array
+
+    def give(self, array):
+        '''
+        return an array to the pool
+        '''
+        self._free.append(array)
+
+
+class PresentationClock(object):
+    '''
+    a playback clock following the audio output
+
+    the clock starts when audio playback starts and can be paused while the
+    audio output starves, so that video frames stay in sync with the sound.
+    between the positions the audio output reports through sync, it runs on
+    wall time.
+    '''
+    def __init__(self):
+        '''
+        constructor
+        '''
+        self._start = None
+        self._paused = None
+
+    def start(self, position=0.0):
+        '''
+        start the clock at the given position in seconds
+        '''
+        self._start = pygame.time.get_ticks() - int(position * 1000)
+        self._paused = None
+
+    def pause(self):
+        '''
+        hold the clock at its current position
+        '''
+        if self._start is not None and self._paused is None:
+            self._paused = pygame.time.get_ticks()
+
+    def resume(self):
+        '''
+        continue a paused clock
+        '''
+        if self._paused is not None:
+            self._start += pygame.time.get_ticks() - self._paused
+            self._paused = None
+
+    def sync(self, low, high=None):
+        '''
+        move the clock into the range of positions in seconds the audio
+        output is known to be at, or to the position low
+        '''
+        if self._start is None:
+            return
+
+        position = self.time
+        target = min(max(position, low), low if high is None else high)
+        self._start -= int(round((target - position) * 1000))
+
+    @property
+    def running(self):
+        '''
+        produce whether the clock has been started
+        '''
+        return self._start is not None
+
+    @property
+    def time(self):
+        '''
+        produce the playback position in seconds
+        '''
+        if self._start is None:
+            return 0.0
+        now = self._paused if self._paused is not None else pygame.time.get_ticks()
+        return (now - self._start) / 1000.0
+
+
+class RingBuffer(object):
+    '''
+    a bounded, thread-safe fifo of decoded items
+
+    the buffer is bounded by the number of items and optionally by the
+    accumulated size of the items in bytes. producers block while the buffer
+    is full, consumers never block unless asked to.
+    '''
+    def __init__(self, depth, max_bytes=None):
+        '''
+        constructor
+        '''
+        self._items = deque()
+        self._depth = depth
+        self._max_bytes = max_bytes
+        self._bytes = 0
+        self._closed = False
+        self._cond = threading.Condition()
+
+    def _full(self, size):
+        '''
+        check whether an item of the given size would overflow the buffer
+        '''
+        if not self._items:
+            return False
+        if len(self._items) >= self._depth:
+            return True
+        return self._max_bytes is not None and self._bytes + size > self._max_bytes
+
+    def put(self, item, size=0):
+        '''
+        append an item, blocking while the buffer is full
+
+        produce False if the buffer was closed and the item was discarded
+        '''
+        with self._cond:
+            while not self._closed and self._full(size):
+                self._cond.wait()
+            if self._closed:
+                return False
+
+            self._items.append((item, size))
+            self._bytes += size
+            self._cond.notify_all()
+            return True
+
+    def get(self, block=False):
+        '''
+        pop the oldest item, or produce None if the buffer is empty
+        '''
+        with self._cond:
+            while block and not self._items and not self._closed:
+                self._cond.wait()
+            if not self._items:
+                return None
+
+            item, size = self._items.popleft()
+            self._bytes -= size
+            self._cond.notify_all()
+            return item
+
+    def peek(self):
+        '''
+        produce the oldest item without removing it, or None if empty
+        '''
+        with self._cond:
+            return self._items[0][0] if self._items else None
+
+    def close(self):
+        '''
+        signal that no more items will be added
+        '''
+        with self._cond:
+            self._closed = True
+            self._cond.notify_all()
+
+    def clear(self):
+        '''
+        discard all buffered items and close the buffer
+        '''
+        with self._cond:
+            self._items.clear()
+            self._bytes = 0
+            self._closed = True
+            self._cond.notify_all()
+
+    @property
+    def finished(self):
+        '''
+        produce whether the buffer is closed and drained
+        '''
+        with self._cond:
+            return self._closed and not self._items
+
+    @property
+    def nbytes(self):
+        '''
+        produce the accumulated size of the buffered items
+        '''
+        return self._bytes
+
+    def __len__(self):
+        '''
+        produce the number of buffered items
+        '''
+        return len(self._items)
+
+
+class StreamDecoder(threading.Thread):
+    '''
+    demux and decode a video resource ahead of time on a worker thread
+
+    video frames are buffered as (time, pixels) with pixels converted to rgb24
+    arrays, or for paletted output and pal8 input, to (indices, palette)
+    pairs as produced by FrameConverter.pal8_planes. the arrays are taken from pool, and
+    consumers give them back once uploaded. audio frames are resampled to
+    the mixer format and collected into chunks of roughly audio_chunk
+    seconds. if a presentation clock is given, frames that are already late
+    are buffered with pixels None instead of being converted.
+    '''
+    def __init__(self, resource, depth=32, max_bytes=None, audio_chunk=0.25, clock=None,
+                 paletted=False):
+        '''
+        constructor - open the container, decoding starts with start()
+        '''
+        super(StreamDecoder, self).__init__(daemon=True)
+
+        # pyav is only needed once a video is actually played
+        import av
+
+        resource.seek(0)
+        self._container = av.open(resource)
+        self._video_stream = self._container.streams.video[0]
+        self._audio_stream = (
+            self._container.streams.audio[0] if self._container.streams.audio else None)
+
+        self._audio_chunk = audio_chunk
+        self._clock = clock
+        self._paletted = paletted
+        self._converter = FrameConverter()
+        self._stopped = threading.Event()
+
+        rate = self._video_stream.average_rate
+        self._frame_time = 1.0 / float(rate) if rate else 0.0
+        self.dropped = 0
+        self.error = None
+
+        self.size = (self._video_stream.width, self._video_stream.height)
+        self.pool = FramePool()
+        self.video = RingBuffer(depth, max_bytes)
+        self.audio = RingBuffer(max(1, depth // 4))
+        if self._audio_stream is None:
+            # without an audio track the clock runs on wall time from the start
+            self.audio.close()
+
+    def run(self):
+        '''
+        decode until the streams are exhausted or the decoder is stopped
+        '''
+        resampler = audio.resampler()
+        rate = audio.frequency()
+        streams = [s for s in (self._video_stream, self._audio_stream) if s is not None]
+
+        samples = []
+        count = 0
+
+        try:
+            for packet in self._container.demux(*streams):
+                for frame in packet.decode():
+                    if self._stopped.is_set():
+                        return
+
+                    if packet.stream is self._video_stream:
+                        self._put_video(frame)
+                        continue
+
+                    for chunk in audio.resample(resampler, frame):
+                        samples.append(chunk)
+                        count += len(chunk)
+                    if count >= self._audio_chunk * rate:
+                        self._put_audio(samples)
+                        samples, count = [], 0
+
+            samples.extend(audio.resample(resampler, None))
+            if samples:
+                self._put_audio(samples)
+        except Exception as ex:  # pylint: disable=broad-except
+            # handed to the consumer, which re-raises it on the main thread
+            self.error = ex
+        finally:
+            self.video.close()
+            self.audio.close()
+            self._container.close()
+
+    def _put_video(self, frame):
+        '''
+        convert a video frame unless it is already late and buffer it
+        '''
+        if (self._clock is not None and self._clock.running and
+                frame.time + self._frame_time < self._clock.time):
+            self.dropped += 1
+            self.video.put((frame.time, None))
+            return
+
+        if self._paletted and frame.format.name == 'pal8':
+            pixels = self._converter.pal8_planes(frame, self.pool.take((frame.height, frame.width)))
+            self.video.put((frame.time, pixels), pixels[0].nbytes)
+            return
+
+        pixels = self.pool.take((frame.height, frame.width, 3))
+        pixels[...] = self._converter.rgb24_view(frame)
+        self.video.put((frame.time, pixels), pixels.nbytes)
+
+    def _put_audio(self, samples):
+        '''
+        join the collected audio samples into a chunk and buffer it
+        '''
+        chunk = numpy.concatenate(samples)
+        self.audio.put(chunk, chunk.nbytes)
+
+    def stop(self):
+        '''
+        stop decoding and discard all buffered data
+
+        the worker closes the container once it noticed, a decoder that was
+        never started closes it right away.
+        '''
+        self._stopped.set()
+        self.video.clear()
+        self.audio.clear()
+        if self.ident is None:
+            self._container.close()
+
+
+class TrackDecoder(threading.Thread):
+    '''
+    decode the audio track of a resource ahead of time on a worker thread
+
+    samples are resampled to the mixer format and buffered in audio as
+    chunks of roughly chunk seconds, for playback through an AudioStream.
+    '''
+    def __init__(self, resource, depth=4, chunk=0.25):
+        '''
+        constructor - open the container, decoding starts with start()
+        '''
+        super(TrackDecoder, self).__init__(daemon=True)
+
+        import av
+
+        resource.seek(0)
+        self._container = av.open(resource)
+        self._chunk = chunk
+        self._stopped = threading.Event()
+
+        self.error = None
+        self.audio = RingBuffer(depth)
+
+    def run(self):
+        '''
+        decode until the track is exhausted or the decoder is stopped
+        '''
+        resampler = audio.resampler()
+        size = self._chunk * audio.frequency()
+
+        samples = []
+        count = 0
+
+        try:
+            for frame in self._container.decode(audio=0):
+                if self._stopped.is_set():
+                    return
+
+                for chunk in audio.resample(resampler, frame):
+                    samples.append(chunk)
+                    count += len(chunk)
+                if count >= size:
+                    chunk = numpy.concatenate(samples)
+                    self.audio.put(chunk, chunk.nbytes)
+                    samples, count = [], 0
+
+            samples.extend(audio.resample(resampler, None))
+            if samples:
+                chunk = numpy.concatenate(samples)
+                self.audio.put(chunk, chunk.nbytes)
+        except Exception as ex:  # pylint: disable=broad-except
+            self.error = ex
+        finally:
+            self.audio.close()
+            self._container.close()
+
+    def stop(self):
+        '''
+        stop decoding and discard all buffered chunks
+        '''
+        self._stopped.set()
+        self.audio.clear()
@@ -0,0 +1,157 @@
+'''
+This module provides text rendering with the bitmap fonts of the game
+'''
+
+import pygame
+from pyablo.cache import ResourceCache
+from pyablo.drawables import Drawable
+from pyablo.resources import Resources
+
+
+# the glyph sheets stack one cell per character code
+_GLYPH_COUNT = 256
+
+# rendered strings shared between text drawables
+_STRINGS = ResourceCache(budget=4 * 1024 * 1024)
+
+# fonts by (size, colour)
+_FONTS = dict()
+
+
+class BitmapFont(object):
+    '''
+    a font built from a glyph sheet
+
+    the sheet is used as atlas as is, only the glyph areas and widths are
+    computed once from the colorkeyed pixels of each cell.
+    '''
+    def __init__(self, sheet, spacing=1):
+        '''
+        constructor - slice the sheet into glyph areas
+        '''
+        # rle accelerated sheets are slow to blit partially, so drop rle
+        sheet.set_colorkey(sheet.get_colorkey())
+
+        self._sheet = sheet
+        self._spacing = spacing
+        self._height = sheet.get_height() // _GLYPH_COUNT
+
+        self._glyphs = []
+        for code in range(_GLYPH_COUNT):
+            cell = pygame.Rect(0, code * self._height, sheet.get_width(), self._height)
+            mask = pygame.mask.from_surface(sheet.subsurface(cell))
+            right = max((rect.right for rect in mask.get_bounding_rects()), default=0)
+            self._glyphs.append(pygame.Rect(cell.left, cell.top, right, self._height))
+
+        # characters without pixels, such as space, get a fixed advance
+        self._blank = self._height // 3
+
+    @property
+    def height(self):
+        '''
+        produce the line height of the font
+        '''
+        return self._height
+
+    def _glyph(self, char):
+        '''
+        produce the atlas area of the given character
+        '''
+        code = ord(char)
+        return self._glyphs[code if code < _GLYPH_COUNT else ord('?')]
+
+    def size(self, text):
+        '''
+        produce the size of the rendered text
+        '''
+        width = sum((self._glyph(char).width or self._blank) + self._spacing for char in text)
+        return (max(0, width - self._spacing), self._height)
+
+    def render(self, text):
+        '''
+        render the text into a new colorkeyed surface with a single blits call
+        '''
+        surface = pygame.Surface(self.size(text), 0, self._sheet)
+        if self._sheet.get_bitsize() == 8:
+            surface.set_palette(self._sheet.get_palette())
+        colorkey = self._sheet.get_colorkey()
+        if colorkey is not None:
+            surface.fill(colorkey)
+            surface.set_colorkey(colorkey, pygame.RLEACCEL)
+
+        blits = []
+        x = 0
+        for char in text:
+            area = self._glyph(char)
+            if area.width:
+                blits.append((self._sheet, (x, 0), area))
+            x += (area.width or self._blank) + self._spacing
+
+        surface.blits(blits, doreturn=False)
+        return surface
+
+
+def font(size='medium', colour='gold'):
+    '''
+    produce the bitmap font of the given size and colour
+    '''
+    key = (size, colour)
+    if key not in _FONTS:
+        sheet = Resources.open('glyph_%s_%s.pcx' % key).source
+        _FONTS[key] = BitmapFont(sheet)
+    return _FONTS[key]
+
+
+def render(text, size='medium', colour='gold'):
+    '''
+    produce the rendered text, shared with previous renders of the same text
+    '''
+    key = (text, size, colour)
+    surface = _STRINGS.get(key)
+    if surface is None:
+        surface = font(size, colour).render(text)
+        _STRINGS.put(key, surface)
+    return surface
+
+
+class Text(Drawable):
+    '''
+    a line of text in one of the bitmap fonts
+    '''
+    __slots__ = ('_size', '_colour', '_text')
+
+    def __init__(self, text='', size='medium', colour='gold'):
+        '''
+        constructor
+        '''
+        super(Text, self).__init__()
+
+        self._size = size
+        self._colour = colour
+        self._text = None
+
+        self.transparent = True
+        self.text = text
+
+    @property
+    def text(self):
+        '''
+        produce the displayed text
+        '''
+        return self._text
+
+    @text.setter
+    def text(self, value):
+        '''
+        change the displayed text
+        '''
+        if value == self._text:
+            return
+
+        self._text = value
+        self._surface = render(value, self._size, self._colour)
+
+        rect = self._surface.get_rect()
+        rect.topleft = self.rect.topleft
+        self.rect = rect
+        self.redraw = True
@@ -0,0 +1,168 @@
+'''
+This module provides an isometric tile layer for drawing dungeon levels
+'''
+
+import numpy
+import pygame
+from pygame import Rect
+from pyablo.cache import ResourceCache
+from pyablo.drawables import Drawable
+
+
+# the colour keyed out of chunks if the tiles have no colorkey
+_COLORKEY = (255, 0, 255)
+
+
+class TileLayer(Drawable):
+    '''
+    a tile map drawn in isometric order
+
+    the map is split into square chunks of cells. a chunk is composited into
+    a surface when it is first drawn, and again only after one of its tiles
+    changed, so a frame blits a few chunks instead of every tile. the chunk
+    surfaces are kept in an LRU cache with a byte budget, chunks evicted
+    while out of view are composited again once they are drawn.
+
+    tiles taller than a cell stand on the bottom of their cell.
+    '''
+    __slots__ = (
+        '_tiles', '_map', '_tile_size', '_chunk', '_overhang', '_chunks', '_rects', '_order',
+        'composited')
+
+    def __init__(self, tiles, tile_map, tile_size=(64, 32), chunk=8, budget=16 * 1024 * 1024):
+        '''
+        constructor
+
+        tiles is a sequence of surfaces of the same format, and tile_map a 2d
+        array of indices into it by row and column. cells with a negative
+        index are empty.
+        '''
+        super(TileLayer, self).__init__()
+
+        self._tiles = list(tiles)
+        self._map = numpy.array(tile_map, numpy.int32)
+        self._tile_size = tile_size
+        self._chunk = chunk
+        self._overhang = max([0] + [tile.get_height() - tile_size[1] for tile in self._tiles])
+
+        self._chunks = ResourceCache(budget)
+        self.composited = 0
+
+        # chunk rects relative to the layer, and the chunks in drawing order
+        (rows, cols) = self._map.shape
+        keys = [(r, c) for r in range(-(-rows // chunk)) for c in range(-(-cols // chunk))]
+        self._rects = dict((key, self._chunk_rect(key)) for key in keys)
+        self._order = sorted(keys, key=lambda key: (key[0] + key[1], key[1]))
+
+        (width, height) = tile_size
+        self.transparent = True
+        self.rect = Rect(
+            0, 0, (rows + cols) * width // 2, (rows + cols) * height // 2 + self._overhang)
+
+    def _cell_pos(self, row, col):
+        '''
+        produce the position of a cell relative to the layer
+        '''
+        (width, height) = self._tile_size
+        rows = self._map.shape[0]
+        return ((col - row + rows - 1) * width // 2, (col + row) * height // 2 + self._overhang)
+
+    def _chunk_rect(self, key):
+        '''
+        produce the rect covered by a chunk relative to the layer
+        '''
+        (width, height) = self._tile_size
+        size = self._chunk
+        (row, col) = (key[0] * size, key[1] * size)
+
+        left = self._cell_pos(row + size - 1, col)[0]
+        top = self._cell_pos(row, col)[1] - self._overhang
+        return Rect(left, top, size * width, size * height + self._overhang)
+
+    def _composite(self, key):
+        '''
+        draw the tiles of a chunk into a new surface, in isometric order
+        '''
+        rect = self._rects[key]
+        height = self._tile_size[1]
+        size = self._chunk
+        (first_row, first_col) = (key[0] * size, key[1] * size)
+        cells = self._map[first_row:first_row + size, first_col:first_col + size]
+        (rows, cols) = cells.shape
+
+        # cells on one diagonal do not overlap, diagonals are drawn back to front
+        sequence = []
+        for diagonal in range(rows + cols - 1):
+            for row in range(max(0, diagonal - cols + 1), min(rows, diagonal + 1)):
+                index = cells[row, diagonal - row]
+                if index < 0:
+                    continue
+
+                tile = self._tiles[index]
+                (x, y) = self._cell_pos(first_row + row, first_col + diagonal - row)
+                sequence.append((tile, (x - rect.left, y + height - tile.get_height() - rect.top)))
+
+        template = self._tiles[0]
+        colorkey = template.get_colorkey() or _COLORKEY
+        surface = pygame.Surface(rect.size, 0, template)
+        if template.get_bitsize() == 8:
+            surface.set_palette(template.get_palette())
+        surface.fill(colorkey)
+        surface.blits(sequence, doreturn=False)
+        surface.set_colorkey(colorkey, pygame.RLEACCEL)
+
+        self.composited += 1
+        return surface
+
+    def tile(self, row, col):
+        '''
+        produce the tile index of a cell
+        '''
+        return int(self._map[row, col])
+
+    def set_tile(self, row, col, index):
+        '''
+        change the tile of a cell, its chunk is composited again and only
+        the cell is redrawn
+        '''
+        if self._map[row, col] == index:
+            return
+
+        self._map[row, col] = index
+        key = (row // self._chunk, col // self._chunk)
+        self._chunks.discard(key)
+
+        (width, height) = self._tile_size
+        (x, y) = self._cell_pos(row, col)
+        cell = Rect(x, y - self._overhang, width, height + self._overhang)
+        self.damage(cell.move(self.rect.topleft))
+
+    def blits(self, rect):
+        '''
+        produce the blits of the chunks covering the given rect
+        '''
+        local = rect.move(-self.rect.left, -self.rect.top)
+
+        result = []
+        for key in self._order:
+            chunk = self._rects[key]
+            if not chunk.colliderect(local):
+                continue
+
+            surface = self._chunks.get(key)
+            if surface is None:
+                surface = self._composite(key)
+                self._chunks.put(key, surface)
+
+            area = local.clip(chunk)
+            result.append((
+                surface, (area.left + self.rect.left, area.top + self.rect.top),
+                area.move(-chunk.left, -chunk.top)))
+        return result
+
+    @property
+    def stats(self):
+        '''
+        produce the chunk statistics as a dict
+        '''
+        return dict(self._chunks.stats, composited=self.composited)
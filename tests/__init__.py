@@ -0,0 +1,3 @@
+'''
+This package holds the unit tests of pyablo, run them with `python setup.py test`
+'''
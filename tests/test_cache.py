@@ -0,0 +1,79 @@
+'''
+This module tests the memory-bounded resource cache
+'''
+
+from pyablo.cache import ResourceCache
+
+
+def test_get_counts_hits_and_misses():
+    '''
+    lookups are counted as hits or misses
+    '''
+    cache = ResourceCache(budget=100)
+    cache.put('a', 'value', size=10)
+
+    assert cache.get('a') == 'value'
+    assert cache.get('b') is None
+    assert (cache.hits, cache.misses) == (1, 1)
+
+
+def test_evicts_least_recently_used():
+    '''
+    entries are evicted in the order they were last used
+    '''
+    cache = ResourceCache(budget=30)
+    for key in 'abc':
+        cache.put(key, key, size=10)
+    cache.get('a')
+    cache.put('d', 'd', size=10)
+
+    assert 'b' not in cache
+    assert all(key in cache for key in 'acd')
+    assert cache.nbytes == 30
+    assert cache.evictions == 1
+
+
+def test_replacing_an_entry_updates_its_size():
+    '''
+    storing a key again accounts for the new size only
+    '''
+    cache = ResourceCache(budget=100)
+    cache.put('a', 'a', size=10)
+    cache.put('a', 'b', size=40)
+
+    assert len(cache) == 1
+    assert cache.nbytes == 40
+
+
+def test_pinned_entries_are_kept():
+    '''
+    pinned entries survive eviction and clear until unpinned
+    '''
+    cache = ResourceCache(budget=20)
+    cache.pin('a')
+    cache.put('a', 'a', size=10)
+    cache.put('b', 'b', size=10)
+    cache.put('c', 'c', size=10)
+    assert 'a' in cache and 'b' not in cache
+
+    cache.clear()
+    assert 'a' in cache and 'c' not in cache
+
+    cache.unpin('a')
+    cache.budget = 0
+    assert len(cache) == 0
+    assert cache.nbytes == 0
+
+
+def test_discard_drops_pinned_entries():
+    '''
+    discard removes an entry even if it is pinned
+    '''
+    cache = ResourceCache(budget=100)
+    cache.pin('a')
+    cache.put('a', 'a', size=10)
+    cache.discard('a')
+    cache.discard('b')
+
+    assert 'a' not in cache
+    assert cache.stats['bytes'] == 0
@@ -0,0 +1,47 @@
+'''
+This module tests the merging of events before dispatch
+'''
+
+import pygame
+from pyablo.events import EventRouter
+
+
+def motion(pos, rel, buttons=(0, 0, 0)):
+    '''
+    produce a mouse motion event
+    '''
+    return pygame.event.Event(pygame.MOUSEMOTION, pos=pos, rel=rel, buttons=buttons)
+
+
+def test_coalesce_merges_runs_of_motion():
+    '''
+    a run of motion events becomes its last event with the summed motion
+    '''
+    router = EventRouter()
+    events = router.coalesce([
+        motion((1, 1), (1, 1)),
+        motion((3, 2), (2, 1), buttons=(1, 0, 0)),
+        motion((6, 2), (3, 0))])
+
+    assert len(events) == 1
+    assert events[0].pos == (6, 2)
+    assert events[0].rel == (6, 2)
+    assert events[0].buttons == (1, 0, 0)
+    assert router.merged == 2
+
+
+def test_coalesce_keeps_other_events_in_order():
+    '''
+    other events end a run of motion events and are kept as they are
+    '''
+    router = EventRouter()
+    click = pygame.event.Event(pygame.MOUSEBUTTONDOWN, pos=(3, 3), button=1)
+    events = router.coalesce([
+        motion((1, 1), (1, 1)), motion((2, 2), (1, 1)), click, motion((4, 4), (2, 2))])
+
+    assert [event.type for event in events] == [
+        pygame.MOUSEMOTION, pygame.MOUSEBUTTONDOWN, pygame.MOUSEMOTION]
+    assert events[0].rel == (2, 2)
+    assert events[1] is click
+    assert events[2].rel == (2, 2)
+    assert router.merged == 1
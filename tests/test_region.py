@@ -0,0 +1,57 @@
+'''
+This module tests the coalescing of dirty rects
+'''
+
+from pygame import Rect
+from pyablo.region import coalesce, merge
+
+
+def test_merge_joins_overlapping_and_adjacent():
+    '''
+    overlapping and edge sharing rects merge into their bounding box
+    '''
+    assert merge([Rect(0, 0, 10, 10), Rect(5, 5, 10, 10)]) == [Rect(0, 0, 15, 15)]
+    assert merge([Rect(0, 0, 10, 10), Rect(10, 0, 10, 10)]) == [Rect(0, 0, 20, 10)]
+
+
+def test_merge_keeps_corners_and_drops_empty():
+    '''
+    rects touching at a corner stay apart, rects without area are dropped
+    '''
+    merged = merge([Rect(0, 0, 10, 10), Rect(10, 10, 10, 10), Rect(50, 50, 0, 10)])
+    assert sorted(merged) == [Rect(0, 0, 10, 10), Rect(10, 10, 10, 10)]
+
+
+def test_merge_repeats_until_stable():
+    '''
+    a merged box that grows into a rect compared earlier absorbs it too
+    '''
+    rects = [Rect(0, 20, 10, 10), Rect(20, 0, 10, 10), Rect(0, 0, 30, 21)]
+    assert merge(rects) == [Rect(0, 0, 30, 30)]
+
+
+def test_merge_does_not_modify_input():
+    '''
+    the given rects are copied before merging
+    '''
+    rects = [Rect(0, 0, 10, 10), Rect(5, 5, 10, 10)]
+    merge(rects)
+    assert rects == [Rect(0, 0, 10, 10), Rect(5, 5, 10, 10)]
+
+
+def test_coalesce_limits_regions():
+    '''
+    too many regions are snapped to tiles, and then to their bounding box
+    '''
+    rects = [Rect(x * 20, 0, 10, 10) for x in range(10)]
+    assert coalesce(rects, limit=16) == merge(rects)
+    assert coalesce(rects, limit=4, tile=64) == [Rect(0, 0, 192, 64)]
+    assert coalesce(rects, limit=1, tile=8) == [Rect(0, 0, 192, 16)]
+
+
+def test_coalesce_clips_to_bounds():
+    '''
+    regions are clipped to the bounds, regions outside of them are dropped
+    '''
+    rects = [Rect(-5, -5, 10, 10), Rect(100, 100, 10, 10)]
+    assert coalesce(rects, bounds=Rect(0, 0, 50, 50)) == [Rect(0, 0, 5, 5)]
@@ -0,0 +1,73 @@
+'''
+This module tests the spatial index of drawables
+'''
+
+from pygame import Rect
+from pyablo.spatial import SpatialGrid
+
+
+class Item(object):
+    '''
+    a stand-in for a scene graph node
+    '''
+    def __init__(self, rect):
+        '''
+        constructor
+        '''
+        self.rect = Rect(rect)
+
+
+def test_query_produces_colliding_items_in_insertion_order():
+    '''
+    only items colliding with the query are produced, in insertion order
+    '''
+    grid = SpatialGrid(cell_size=32)
+    items = [Item((100, 100, 10, 10)), Item((0, 0, 40, 40)), Item((30, 30, 10, 10))]
+    for item in items:
+        grid.insert(item, item.rect)
+
+    assert grid.query([Rect(35, 35, 2, 2)]) == [items[1], items[2]]
+    assert grid.query([Rect(0, 0, 200, 200)]) == items
+    assert grid.query([Rect(50, 50, 10, 10)]) == []
+
+
+def test_move_keeps_order():
+    '''
+    moved items are found at their new rect, and keep their order
+    '''
+    grid = SpatialGrid(cell_size=32)
+    (first, second) = (Item((0, 0, 10, 10)), Item((100, 0, 10, 10)))
+    grid.insert(first, first.rect)
+    grid.insert(second, second.rect)
+
+    first.rect = Rect(100, 0, 10, 10)
+    grid.move(first, first.rect)
+
+    assert grid.query([Rect(0, 0, 10, 10)]) == []
+    assert grid.query([Rect(100, 0, 10, 10)]) == [first, second]
+
+
+def test_insert_again_moves():
+    '''
+    inserting an indexed item again moves it instead of adding it twice
+    '''
+    grid = SpatialGrid()
+    item = Item((0, 0, 10, 10))
+    grid.insert(item, item.rect)
+    item.rect = Rect(200, 200, 10, 10)
+    grid.insert(item, item.rect)
+
+    assert len(grid) == 1
+    assert grid.query([Rect(200, 200, 1, 1)]) == [item]
+
+
+def test_empty_rects_cover_no_cells():
+    '''
+    items without area are indexed, but never found
+    '''
+    grid = SpatialGrid()
+    item = Item((10, 10, 0, 0))
+    grid.insert(item, item.rect)
+
+    assert len(grid) == 1
+    assert grid.query([Rect(0, 0, 100, 100)]) == []
@@ -0,0 +1,90 @@
+'''
+This module tests the buffers between decoder threads and the main loop
+'''
+
+import threading
+from pyablo.stream import RingBuffer
+
+
+def test_fifo_order_and_size():
+    '''
+    items come out in the order they went in, sizes are accounted
+    '''
+    buffer = RingBuffer(4)
+    for item in range(3):
+        buffer.put(item, size=10)
+
+    assert len(buffer) == 3
+    assert buffer.nbytes == 30
+    assert buffer.peek() == 0
+    assert [buffer.get() for _ in range(4)] == [0, 1, 2, None]
+    assert buffer.nbytes == 0
+
+
+def test_put_blocks_while_full():
+    '''
+    a producer waits until a consumer makes room
+    '''
+    buffer = RingBuffer(1)
+    buffer.put('first')
+
+    producer = threading.Thread(target=buffer.put, args=('second',))
+    producer.start()
+    producer.join(0.05)
+    assert producer.is_alive()
+
+    assert buffer.get() == 'first'
+    producer.join(1)
+    assert not producer.is_alive()
+    assert buffer.get() == 'second'
+
+
+def test_byte_bound_admits_one_oversized_item():
+    '''
+    the byte bound applies unless the buffer is empty
+    '''
+    buffer = RingBuffer(10, max_bytes=100)
+    buffer.put('large', size=150)
+    assert len(buffer) == 1
+
+    producer = threading.Thread(target=buffer.put, args=('small', 10))
+    producer.start()
+    producer.join(0.05)
+    assert producer.is_alive()
+
+    buffer.get()
+    producer.join(1)
+    assert buffer.get() == 'small'
+
+
+def test_close_wakes_producers_and_consumers():
+    '''
+    closing discards pending puts and ends blocking gets once drained
+    '''
+    buffer = RingBuffer(1)
+    buffer.put('kept')
+
+    results = []
+    producer = threading.Thread(target=lambda: results.append(buffer.put('discarded')))
+    producer.start()
+    buffer.close()
+    producer.join(1)
+
+    assert results == [False]
+    assert not buffer.finished
+    assert buffer.get(block=True) == 'kept'
+    assert buffer.get(block=True) is None
+    assert buffer.finished
+
+
+def test_clear_drops_items():
+    '''
+    clear discards the buffered items and closes the buffer
+    '''
+    buffer = RingBuffer(4)
+    buffer.put('item', size=10)
+    buffer.clear()
+
+    assert buffer.finished
+    assert buffer.nbytes == 0
+    assert buffer.put('late') is False